@@ -37,7 +37,7 @@ def switch_customer():
 @cust.route('/api/customers', methods=['GET'])
 def list_customers():
     all_customers = cs.list_all_customers()
-    return jsonify([c.__dict__ for c in all_customers]), 200
+    return jsonify(all_customers), 200
 
 
 @cust.route('/api/customers', methods=['POST'])
@@ -65,7 +65,7 @@ def create_customer():
     # Create customer only
     if addr_data is None:
         cs.create_customer(new_customer)
-        return jsonify({"customer": new_customer.__dict__}), 201
+        return jsonify({"customer": new_customer}), 201
 
     # Create customer with address
     addr_data = data['address']
@@ -76,12 +76,12 @@ def create_customer():
 
     new_address = Address(addr_data)
     cs.create_customer(new_customer, new_address)
-    return jsonify({'customer': new_customer.__dict__, 'address': new_address.__dict__}), 201
+    return jsonify({'customer': new_customer, 'address': new_address}), 201
 
 
 @cust.route('/api/customer/<customer_id>', methods=['GET'])
 def get_customer(customer_id):
-    return cs.get_one_customer(customer_id).json(), 200
+    return jsonify(cs.get_one_customer(customer_id)), 200
 
 
 @cust.route('/api/customer/<customer_id>', methods=['PUT'])
@@ -96,7 +96,7 @@ def update_customer(customer_id):
             customer.__dict__[key] = value
 
     cs.update_customer(customer)
-    return customer.json(), 200
+    return jsonify(customer), 200
 
 
 @cust.route('/api/customer/<customer_id>', methods=['DELETE'])
@@ -127,13 +127,13 @@ def create_address(customer_id):
 
     new_address = Address(data)
     cs.create_customer_address(customer_id, new_address)
-    return new_address.json(), 201
+    return jsonify(new_address), 201
 
 
 @cust.route('/api/customer/<customer_id>/addresses', methods=['GET'])
 def list_addresses(customer_id):
     cust_addresses = cs.list_customer_addresses(customer_id)
-    return jsonify([addr.__dict__ for addr in cust_addresses]), 200
+    return jsonify(cust_addresses), 200
 
 
 @cust.route('/api/customer/<customer_id>/addresses/<address_id>', methods=['PUT'])
@@ -151,7 +151,7 @@ def update_address(customer_id, address_id):
             address.__dict__[key] = value
 
     cs.update_address(address)
-    return address.json(), 200
+    return jsonify(address), 200
 
 
 @cust.route('/api/customer/<customer_id>/address/<address_id>', methods=['DELETE'])
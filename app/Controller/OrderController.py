@@ -55,10 +55,9 @@ def submit_order():
     )
 
     # Line obj is OrderDetail obj
-    return result_order.json(), 201
+    return jsonify(result_order), 201
 
 
 @order.route('/api/order/<order_id>', methods=['GET'])
 def get_order(order_id):
-    res = order_service.get_order(order_id).json()
-    return res, 200
+    return jsonify(order_service.get_order(order_id)), 200
@@ -1,7 +1,11 @@
+from app import config
+from app.Exception.exceptions import LackRequiredData, IncorrectDataType, TooManyItems
 from app.Util import AuthUtil as authUtil
+from app.Util.CatalogVersion import conditional
 from app.Service import ProductService as product_service
 from flask import (
     Blueprint,
+    Response,
     redirect,
     request,
     jsonify,
@@ -14,21 +18,51 @@ product = Blueprint('product', __name__)
 # Example of the API call
 # http://127.0.0.1:3000/api/product?sessionKey=8A96E4EF6C4C9ECC4938A7DB816346DC&barcode=9326243001262
 @product.route('/api/barcode', methods=['GET'])
+@conditional
 def get_barcode_product():
     barcode = request.args.get('barcode')
     return jsonify(product_service.get_product_by_barcode(barcode))
 
 
+# Example of the API call
+# POST http://127.0.0.1:3000/api/barcodes with {"barcodes": ["9326243001262", "933044000895"]}
+@product.route('/api/barcodes', methods=['POST'])
+def get_barcode_products():
+    data = request.get_json(silent=True) or {}
+    barcodes = data.get('barcodes')
+    if barcodes is None:
+        raise LackRequiredData('barcodes')
+    if type(barcodes) is not list or not all(type(barcode) is str for barcode in barcodes):
+        raise IncorrectDataType('barcodes')
+    if len(barcodes) > config.BARCODE_BATCH_LIMIT:
+        raise TooManyItems('barcodes', config.BARCODE_BATCH_LIMIT)
+    return jsonify(product_service.get_products_by_barcodes(barcodes))
+
+
 # Example of the API call
 # http://127.0.0.1:3000/api/product?sessionKey=8A96E4EF6C4C9ECC4938A7DB816346DC&productCode=01248
 @product.route('/api/product', methods=['GET'])
+@conditional
 def get_product_by_id():
     product_code = request.args.get('productCode')
     return jsonify(product_service.get_product_by_product_code(product_code))
 
+# Example of the API call
+# http://127.0.0.1:3000/api/product/detail?barcode=9326243001262
+# http://127.0.0.1:3000/api/product/detail?productCode=CFP-600-12-LPP-200
+@product.route('/api/product/detail', methods=['GET'])
+@conditional
+def get_product_detail():
+    for identifier_type in ('barcode', 'productCode'):
+        identifier = request.args.get(identifier_type)
+        if identifier is not None:
+            return jsonify(product_service.get_product_detail(identifier, identifier_type))
+    raise LackRequiredData('barcode or productCode')
+
 # Example of the API call
 # http://localhost:3000/api/products/search?identifier=CFP&identifierType=productCode
 @product.route('/api/products/search', methods=['GET'])
+@conditional
 def search_products():
     identifier = request.args.get('identifier')
     identifierType = request.args.get('identifierType')
@@ -68,6 +102,13 @@ def update_product_price():
     return jsonify(product_service.update_prices())
 
 
+# This method is not called from the front end.
+# Hit, miss and eviction counters of the product lookup cache
+@product.route('/cacheStats', methods=['GET'])
+def cache_stats():
+    return jsonify(product_service.cache_stats())
+
+
 @product.route('/metadata/import', methods=['POST'])
 def import_metadata():
     data = request.get_json(silent=True)
@@ -81,6 +122,7 @@ def import_threedmodel():
 
 
 @product.route('/api/metadata/get', methods=['GET'])
+@conditional
 def get_metadata_by_product_code():
     product_code = request.args.get('productCode')
     return jsonify(product_service.get_metadata_by_product_code(product_code))
@@ -92,25 +134,32 @@ def update_product_categories():
 
 
 @product.route('/api/categories', methods=['GET'])
+@conditional
 def list_categories():
-    parents, children = product_service.list_all_categories()
-    categories = []
-    for category in parents:
-        p_cate_dict = category.__dict__
-        if category.keyCategoryID not in children:
-            p_cate_dict['Children'] = []
-        else:
-            p_cate_dict['Children'] = [child.__dict__ for child in children[category.keyCategoryID]]
-        categories.append(p_cate_dict)
+    # Served from the tree built after each category sync, 304 when the client has it already
+    body, etag = product_service.get_category_tree()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
-    return jsonify(categories), 200
+
+# Example of the API call
+# http://127.0.0.1:3000/api/catalog/export
+@product.route('/api/catalog/export', methods=['GET'])
+@conditional
+def export_catalog():
+    return Response(product_service.export_catalog(), mimetype='application/x-ndjson')
 
 
 @product.route('/api/products', methods=['GET'])
+@conditional
 def list_products_with_pagination():
     params = request.args
     category_id = params.get('cate')
     page = params.get('page')
+    # Keyset pagination: 'after' is the 'next' cursor of the previous page, empty for the first page
+    after = params.get('after')
+    with_total = after is None or params.get('total') == '1'
     if category_id is not None:
         category_id = int(category_id)
 
@@ -119,7 +168,7 @@ def list_products_with_pagination():
     else:
         page = 1
 
-    ret_set = product_service.list_all_products(category_id, page)
+    ret_set = product_service.list_all_products(category_id, page, after=after, with_total=with_total)
 
     items = [prod.basic_dict() for prod in ret_set['items']]
     ret_set['items'] = items
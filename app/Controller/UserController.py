@@ -4,7 +4,6 @@ from app.Resource.SessionResource import SessionResource
 from flask import Blueprint, request, jsonify, session
 from requests.sessions import Session
 from app.Util import AuthUtil as authUtil
-from app.Resource.UserResource import UserResource
 from app.Service import UserService as user_service
 from app.Model.User import User
 
@@ -14,9 +13,6 @@ logging.basicConfig(level=logging.DEBUG)
 # Configure Flask application
 user = Blueprint('user', __name__)
 
-# Initialise database resource objects
-user_resource = UserResource()
-session_resource = SessionResource()
 
 # Set routes
 @user.route('/api/login', methods=['POST'])
@@ -40,7 +36,7 @@ def login_post():
 def logout():
     login_session = session.get('login_session')
     if authUtil.validate_login_session():
-        session_resource.delete_session(login_session)
+        SessionResource().delete_session(login_session)
         session.pop('login_session ', None)
         session.pop('session_id ', None)
         session.pop('org_id', None)
@@ -40,6 +40,24 @@ class PaginationError(HTTPException):
         self.code = 404
 
 
+class PoolTimeout(HTTPException):
+    def __init__(self):
+        self.description = "Timed out waiting for a database connection."
+        self.code = 503
+
+
+class TransactionRolledBack(HTTPException):
+    def __init__(self):
+        self.description = "The transaction was rolled back, nothing was saved."
+        self.code = 500
+
+
+class SchemaOutdated(HTTPException):
+    def __init__(self, migration, tables):
+        self.description = f"Migration {migration} is not applied to {', '.join(tables)}, run 'python -m app.migrate'."
+        self.code = 500
+
+
 """Business Logic Exceptions"""
 
 
@@ -56,6 +74,12 @@ class IncorrectDataType(HTTPException):
         self.code = 400
 
 
+class TooManyItems(HTTPException):
+    def __init__(self, msg, limit):
+        self.description = f"Too many items for key '{msg}', at most {limit} are allowed."
+        self.code = 400
+
+
 class SquizzException(HTTPException):
     def __init__(self, msg):
         self.description = {msg}
@@ -35,14 +35,33 @@ class Model:
                     if self.__dict__[key] is not None:
                         self.__dict__[key] = self.__dict__[key].rstrip()
 
+            self.after_load()
+
         elif pk is not None:
             self.id = int(pk)
 
         else:
             return
 
+    def after_load(self):
+        """
+        Hook run once the fields have been loaded from a JSON object
+        or a database row, for subclasses that post-process them
+        """
+        pass
+
     def json(self):
         """
-        Serializes the subclass model object into a JSON string
+        Serializes the subclass model object into a JSON string,
+        nested models (e.g. Order.lines) are serialized as dicts
+        """
+        from app.Util.Serializer import default
+        return json.dumps(self.__dict__, default=default)
+
+    def to_json_bytes(self) -> bytes:
+        """
+        Serializes the subclass model object into compact JSON bytes with
+        the response serializer, see app.Util.Serializer
         """
-        return json.dumps(self.__dict__)
+        from app.Util.Serializer import dumps
+        return dumps(self)
@@ -33,6 +33,8 @@ class Order(Model):
         self.billStatus = None
         self.customer_id = None
         super().__init__(json, pk)
+
+    def after_load(self):
         if self.createdDate is not None:
             self.createdDate = self.createdDate.strftime("%Y-%m-%d  %H:%M:%S")
 
@@ -72,10 +74,3 @@ class Order(Model):
             'billStatus': 'billStatus',
             'customer_id': 'customer_id'
         }
-
-    def json(self):
-        if self.lines is not None:
-            lines = [line.__dict__ for line in self.lines]
-            self.lines = lines
-
-        return super().json()
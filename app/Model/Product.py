@@ -96,9 +96,3 @@ class Product(Model):
             'price': self.price,
             'image': [image.__dict__ for image in self.imageList]
         }
-
-    def json(self):
-        if self.imageList is not None:
-            self.imageList = [image.__dict__ for image in self.imageList]
-
-        return super().json()
@@ -1,34 +1,435 @@
+import hashlib
+import json
 import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
 import pymysql
 from pymysql import IntegrityError
+from pymysql.constants import SERVER_STATUS
 from werkzeug.exceptions import HTTPException
 from app import config
+from app.Exception.exceptions import PoolTimeout, TransactionRolledBack
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 
+def _connect():
+    """Open a new raw connection to the MySQL database"""
+    return pymysql.connect(host=config.HOST,
+                           user=config.USER,
+                           password=config.PASSWORD,
+                           db=config.DB_NAME,
+                           charset='utf8mb4',
+                           cursorclass=pymysql.cursors.DictCursor,
+                           autocommit=False,
+                           read_timeout=None,
+                           write_timeout=None)
+
+
+def chunked(items, batch_size, max_bytes=None, size_of=None):
+    """
+    Split an iterable into lists of at most batch_size items. When max_bytes
+    is given, a chunk is also closed before the summed size_of(item) of its
+    items would exceed it.
+    """
+    chunk, size = [], 0
+    for item in items:
+        item_size = size_of(item) if max_bytes else 0
+        if chunk and (len(chunk) >= batch_size or (max_bytes and size + item_size > max_bytes)):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += item_size
+    if chunk:
+        yield chunk
+
+
+def row_size(values):
+    """Rough number of bytes a row of values takes in a multi-row statement"""
+    return sum(len(str(value)) for value in values) + 4 * len(values)
+
+
+def content_hash(values) -> str:
+    """
+    Hash of a row of values, to tell whether a record changed since it was
+    last written. Equal values give equal hashes across processes.
+    """
+    data = json.dumps(values, default=str, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.md5(data.encode()).hexdigest()
+
+
+@lru_cache(maxsize=64)
+def row_placeholders(num_fields):
+    """Placeholders of one row, e.g. (%s,%s)"""
+    return '(' + ','.join(['%s'] * num_fields) + ')'
+
+
+def values_clause(num_fields, num_rows):
+    """Placeholders for a multi-row VALUES clause, e.g. (%s,%s),(%s,%s)"""
+    return ','.join([row_placeholders(num_fields)] * num_rows)
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of MySQL connections shared by every Resource object.
+
+    Connections are created lazily up to `size`. On checkout, a connection
+    that has been idle for longer than `max_idle` seconds is evicted, and one
+    idle for longer than `ping_interval` seconds is pinged first. When every
+    connection is in use, the caller waits up to `timeout` seconds before
+    PoolTimeout is raised.
+    """
+
+    def __init__(self, size=None, timeout=None, max_idle=None, ping_interval=None, connect=_connect):
+        self.size = size or config.DB_POOL_SIZE
+        self.timeout = timeout or config.DB_POOL_TIMEOUT
+        self.max_idle = max_idle or config.DB_POOL_MAX_IDLE
+        self.ping_interval = config.DB_POOL_PING_INTERVAL if ping_interval is None else ping_interval
+        self._connect = connect
+        self._idle = deque()  # (connection, last checkin time), most recently used on the right
+        self._created = 0
+        self._lock = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'evicted': 0,
+            'failed_pings': 0
+        }
+
+    def acquire(self):
+        """Check out a healthy connection, creating one if the pool is not full"""
+        deadline = None
+        with self._lock:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn, last_used = None, None
+                    break
+
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._stats['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    logger.error('Timed out waiting for a database connection')
+                    raise PoolTimeout()
+                self._lock.wait(remaining)
+
+            self._stats['checkouts'] += 1
+
+        # Connect and ping outside of the lock, these involve network round-trips
+        if conn is not None and time.monotonic() - last_used > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception as e:
+                logger.info('Discarding broken pooled connection: %s', e)
+                self._count('failed_pings')
+                self._close(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                    self._lock.notify()
+                raise
+            self._count('created')
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any uncommitted work"""
+        healthy = conn.open
+        if healthy and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                conn.rollback()
+            except Exception as e:
+                logger.info('Discarding pooled connection after failed rollback: %s', e)
+                healthy = False
+
+        with self._lock:
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._created -= 1
+            self._lock.notify()
+
+        if not healthy:
+            self._close(conn)
+
+    def stats(self):
+        """Return a snapshot of the pool counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._created - len(self._idle)
+        return stats
+
+    def close_all(self):
+        """Close every idle connection, connections in use are closed on checkin"""
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._created -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def _evict_idle(self):
+        # The oldest connections sit on the left, stop at the first fresh one
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._created -= 1
+            self._stats['evicted'] += 1
+            self._close(conn)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+pool = ConnectionPool()
+
+
+class PooledConnection:
+    """
+    Wraps a pooled connection so Resources can keep using it like a plain
+    pymysql connection. close() hands the connection back to the pool and
+    ping(reconnect=True) checks a new one out again.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+        self._conn = pool.acquire()
+
+    @property
+    def open(self):
+        return self._conn is not None and self._conn.open
+
+    def ping(self, reconnect=True):
+        if self._conn is None:
+            if not reconnect:
+                raise pymysql.err.Error('Connection already returned to the pool')
+            self._conn = self._pool.acquire()
+        else:
+            self._conn.ping(reconnect)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def rollback(self):
+        # A connection returned to the pool has already been rolled back
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise pymysql.err.InterfaceError(0, 'Connection already returned to the pool')
+        return getattr(self._conn, name)
+
+
+class UnitOfWork:
+    """
+    One connection and one transaction shared by every Resource object
+    created while the unit is active. Use it through unit_of_work().
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = pool.acquire()
+        self.failed = False
+
+    def finish(self, commit: bool):
+        """
+        Commit or roll back and return the connection to the pool. Raises
+        TransactionRolledBack if a commit is asked for but the unit failed,
+        e.g. a nested block's error was caught, so the caller never takes
+        the rollback for a success.
+        """
+        conn, self.conn = self.conn, None
+        try:
+            if commit and not self.failed:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            self.pool.release(conn)
+        if commit and self.failed:
+            raise TransactionRolledBack()
+
+
+class BorrowedConnection:
+    """
+    The view of a unit of work's connection handed to each Resource.
+    commit() and close() are deferred to the end of the unit, rollback()
+    rolls back and marks the whole unit as failed. A lost connection is
+    not reconnected, the unit fails instead.
+    """
+
+    def __init__(self, unit):
+        self._unit = unit
+
+    @property
+    def open(self):
+        return self._unit.conn is not None and self._unit.conn.open
+
+    def ping(self, reconnect=True):
+        # Never reconnect: the statements that follow would run in a new session, outside
+        # of the unit's transaction, and be committed without the work done before
+        try:
+            self._get().ping(False)
+        except Exception:
+            self._unit.failed = True
+            raise
+
+    def fail(self):
+        """Mark the unit as failed, it is rolled back when it ends"""
+        self._unit.failed = True
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._unit.failed = True
+        if self._unit.conn is not None:
+            self._unit.conn.rollback()
+
+    def close(self):
+        pass
+
+    def _get(self):
+        if self._unit.conn is None:
+            raise pymysql.err.InterfaceError(0, 'Unit of work already finished')
+        return self._unit.conn
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+_local = threading.local()
+
+# Server settings read once per process, see DatabaseBase.server_variables
+_server_variables = {}
+
+# Errors after which the server no longer holds the transaction: ER_LOCK_DEADLOCK,
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST
+TRANSACTION_LOST = {1213, 2006, 2013}
+
+
+@contextmanager
+def unit_of_work():
+    """
+    Runs the enclosed block as a single transaction. Every Resource created
+    inside the block shares one connection, the transaction is committed
+    once when the block exits and rolled back if it raises. Nested blocks
+    join the outermost unit. If the unit failed without the block raising,
+    e.g. a nested block's error was caught, it is rolled back and
+    TransactionRolledBack is raised. Can also be used as a function decorator.
+    """
+    unit = getattr(_local, 'unit', None)
+    if unit is not None:
+        try:
+            yield unit
+        except BaseException:
+            unit.failed = True
+            raise
+        return
+
+    unit = UnitOfWork(pool)
+    _local.unit = unit
+    try:
+        yield unit
+    except BaseException:
+        _local.unit = None
+        unit.finish(commit=False)
+        raise
+    else:
+        _local.unit = None
+        unit.finish(commit=True)
+
+
 class DatabaseBase:
     """
     This class represents an abstract base class for database operations.
-    It is responsible for establishing a connection to the database and
-    executing SQL queries.
+    It is responsible for borrowing a connection from the pool and
+    executing SQL queries. The connection goes back to the pool when
+    it is closed or when the Resource object is garbage collected.
+    Inside unit_of_work() all Resources share the unit's connection.
     """
 
     def __init__(self):
-        # Establish a connection to the database
-        self.connection = pymysql.connect(host=config.HOST,
-                                          user=config.USER,
-                                          password=config.PASSWORD,
-                                          db=config.DB_NAME,
-                                          charset='utf8mb4',
-                                          cursorclass=pymysql.cursors.DictCursor,
-                                          autocommit=False,
-                                          read_timeout=None,
-                                          write_timeout=None)
-
+        # Join the active unit of work, or borrow a connection from the pool
+        unit = getattr(_local, 'unit', None)
+        if unit is not None:
+            self.connection = BorrowedConnection(unit)
+        else:
+            self.connection = PooledConnection(pool)
         self.cursor = self.connection.cursor()
-        # self.connection.get_autocommit()
+
+    def __del__(self):
+        connection = getattr(self, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _ensure_connection(self):
+        if not self.connection.open:
+            logger.info("Reconnecting to the database")
+            self.connection.ping(reconnect=True)
+            self.cursor = self.connection.cursor()
+
+    def _statement_failed(self, e):
+        """
+        Drop the connection after a failed statement. Inside a unit of work
+        the connection is kept, but the unit is marked as failed if the
+        server rolled back its transaction, so that statements retried
+        afterwards are not committed on their own.
+        """
+        if isinstance(self.connection, BorrowedConnection) and e.args and e.args[0] in TRANSACTION_LOST:
+            self.connection.fail()
+        self.connection.close()
+
+    def server_variables(self):
+        """
+        Server settings that bulk statements depend on:
+            max_allowed_packet          largest statement the server accepts
+            auto_increment_increment    step between generated ids
+        """
+        if not _server_variables:
+            ret = self.run_query('SELECT @@max_allowed_packet AS max_allowed_packet, '
+                                 '@@auto_increment_increment AS auto_increment_increment', [], False)
+            _server_variables.update(ret[0])
+        return _server_variables
+
+    def packet_limit(self):
+        """Bytes of row data a bulk statement may carry, half the packet size leaves room for escaping"""
+        return self.server_variables()['max_allowed_packet'] // 2
 
     def run_query(self, query: str, values: list, commit: bool = False):
         """
@@ -39,9 +440,7 @@ class DatabaseBase:
             values: a list of values for the query
             commit: indicates whether to commit after execution
         """
-        while not self.connection.open:
-            self.connection.ping(reconnect=True)
-            logger.info("Reconnecting to the database")
+        self._ensure_connection()
         try:
             self.cursor.execute(query, values)
             if commit:
@@ -49,9 +448,36 @@ class DatabaseBase:
             return None if not self.cursor.rowcount else self.cursor.fetchall()
         except Exception as e:
             logger.error("Could not execute the query %s", str(e))
-            self.connection.close()
+            self._statement_failed(e)
             raise e
 
+    def iter_query(self, query: str, values: list, batch_size: int = 1000):
+        """
+        Runs an SQL query with an unbuffered server-side cursor and yields
+        the result in lists of at most batch_size rows, so the whole result
+        set is never held in memory. The connection can not run other
+        queries until the generator is exhausted or closed.
+
+        Args:
+            query: a MySQL query string
+            values: a list of values for the query
+            batch_size: number of rows fetched from the server at a time
+        """
+        self._ensure_connection()
+        cursor = self.connection.cursor(pymysql.cursors.SSDictCursor)
+        try:
+            cursor.execute(query, values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        except Exception as e:
+            logger.error("Could not execute the query %s", str(e))
+            raise e
+        finally:
+            cursor.close()
+
     def run_query_many(self, query: str, values: list, commit: bool = False):
         """
         Runs an SQL query against the MySQL database and returns the result
@@ -61,9 +487,7 @@ class DatabaseBase:
             values: a list of values for the query
             commit: indicates whether to commit after execution
         """
-        while not self.connection.open:
-            self.connection.ping(reconnect=True)
-            logger.info("Reconnecting to the database")
+        self._ensure_connection()
         try:
             self.cursor.executemany(query, values)
             if commit:
@@ -71,24 +495,23 @@ class DatabaseBase:
             return None if not self.cursor.rowcount else self.cursor.fetchall()
         except Exception as e:
             logger.error("Could not execute the query %s", str(e))
-            self.connection.close()
+            self._statement_failed(e)
+            raise e
+
+    def run_as_transaction(self, queries: list):
+        """
+        Run list of queries as a transaction,
+        commit if no errors occurred
+        rollback if any error occurred
+        Args:
+            queries: [{'query': '', 'values': [...]}, ...]
+        """
+        self._ensure_connection()
+        try:
+            for each in queries:
+                self.cursor.execute(each['query'], each['values'])
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            logger.error("Could not execute the query %s", str(e))
             raise e
-    # TODO to be finalized and tested
-    # def run_as_transaction(self, queries: list):
-    #     """
-    #     Run list of queries as a transaction,
-    #     commit if no errors occurred
-    #     rollback if any error occurred
-    #     Args:
-    #         queries: [{'query': '', 'values': [...]}, ...]
-    #     """
-    #     try:
-    #         for each in queries:
-    #             self.cursor.execute(each['query'], each['values'])
-    #         self.connection.commit()
-    #         self.connection.close()
-    #     except Exception as e:
-    #         self.connection.rollback()
-    #         self.connection.close()
-    #         logger.error("Could not execute the query %s", str(e))
-    #         raise e
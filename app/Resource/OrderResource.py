@@ -3,7 +3,7 @@ import datetime
 from app.Model.Address import Address
 from app.Model.Customer import Customer
 from app.Model.Organization import Organization
-from app.Resource.DatabaseBase import DatabaseBase
+from app.Resource.DatabaseBase import DatabaseBase, unit_of_work
 from app.Resource.SimpleModelResource import SimpleModelResource as SR
 from app.Model.Order import Order
 from app.Model.OrderDetail import OrderDetail
@@ -115,19 +115,12 @@ class OrderResource(DatabaseBase):
         new_order.customer_id = customer.id
 
         # Create Order and Related Order lines
-        sr = SR()
-        try:
+        with unit_of_work():
+            sr = SR()
             sr.insert(new_order, False)
             for line in order_details_list:
                 line.orderId = new_order.id
                 sr.insert(line, False)
 
-        except Exception as e:
-            sr.connection.rollback()
-            sr.cursor.close()
-            raise e
-        else:
-            sr.connection.commit()
-            sr.cursor.close()
-            new_order.lines = order_details_list
-            return new_order
+        new_order.lines = order_details_list
+        return new_order
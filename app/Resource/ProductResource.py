@@ -4,18 +4,117 @@ from collections import defaultdict
 
 import math
 from app import config
-from app.Exception.exceptions import OtherException, PaginationError
-from app.Resource.DatabaseBase import DatabaseBase
+from app.Exception.exceptions import OtherException, PaginationError, IncorrectDataType, SchemaOutdated
+from app.Resource.DatabaseBase import DatabaseBase, chunked, content_hash, row_size, values_clause
 from app.Resource.SimpleModelResource import SimpleModelResource as SR
+from app.Util.Pagination import encode_cursor, decode_cursor
+from app.Util.Cache import count_cache
 from app.Model.Price import Price
 from app.Model.Product import Product
 from app.Model.BarcodeProduct import BarcodeProduct
+from app.Model.CateProd import CateProd
+from app.Model.Category import Category
 from app.Model.Image import Image
-from typing import List
+from typing import Iterable, List
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# Columns of the 'products' table written by a sync from SQUIZZ, in the order of product_values()
+PRODUCT_COLUMNS = ['KeyProductId', 'Barcode', 'BarcodeInner', 'Description1', 'Description2', 'Description3',
+                   'Description4', 'InternalId', 'Brand', 'Height', 'Depth', 'Width', 'Weight', 'Volume',
+                   'ProductCondition', 'IsPriceTaxInclusive', 'IsKitted', 'KeyTaxcodeId', 'StockQuantity',
+                   'ProductName', 'KitProductsSetPrice', 'ProductCode', 'ProductSearchCode', 'StockLowQuantity',
+                   'AverageCost', 'ProductDrop', 'PackQuantity', 'SupplierOrganizationId', 'KeySellUnitID',
+                   'ContentHash']
+
+
+def product_values(product: Product) -> list:
+    """Values of a product retrieved from SQUIZZ and their content_hash(), in the order of PRODUCT_COLUMNS"""
+    values = [
+        product.keyProductID,
+        product.barcode,
+        product.barcodeInner,
+        product.description1,
+        product.description2,
+        product.description3,
+        product.description4,
+        product.internalID,
+        product.brand,
+        product.height,
+        product.depth,
+        product.width,
+        product.weight,
+        product.volume,
+        product.productCondition,
+        product.isPriceTaxInclusive,
+        product.isKitted,
+        product.keyTaxcodeID,
+        product.stockQuantity,
+        product.name,
+        product.kitProductsSetPrice,
+        product.productCode,
+        product.productSearchCode,
+        product.stockLowQuantity,
+        product.averageCost,
+        product.drop,
+        product.packQuantity,
+        config.SUPPLIER_ORG_ID,
+        product.keySellUnitID
+    ]
+    values.append(content_hash(values))
+    return values
+
+
+# Columns that /api/products/search looks up by prefix
+SEARCHABLE_IDENTIFIERS = ('barcode', 'productCode')
+
+# Columns of the 'prices' table written by a sync from SQUIZZ, price_values() followed by the product's id
+PRICE_COLUMNS = ['KeyProductId', 'keySellUnitID', 'Price', 'ReferenceId', 'ReferenceType', 'ContentHash', 'ProductId']
+
+
+def price_values(price: Price) -> list:
+    """Values of a price retrieved from SQUIZZ and their content_hash(), in the order of PRICE_COLUMNS"""
+    values = [price.keyProductID, price.keySellUnitID, price.price, price.referenceID, price.referenceType]
+    values.append(content_hash(values))
+    return values
+
+
+# Tables whose contentHash column, added by migration 0002, the syncs write
+CONTENT_HASH_TABLES = ('products', 'prices')
+
+# Set once the contentHash columns are known to exist, a column is never dropped while running
+_content_hash_checked = False
+
+
+# Fixed parts of the bulk statements below. Only these are built once, the VALUES
+# part depends on the number of rows, which chunking by bytes makes nearly arbitrary
+INSERT_PRICES = f"INSERT INTO prices ({', '.join(PRICE_COLUMNS)}) VALUES "
+UPSERT_PRODUCTS = f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES "
+UPSERT_PRODUCTS_UPDATES = ' ON DUPLICATE KEY UPDATE ' + ', '.join(
+    [f'{column} = VALUES({column})' for column in PRODUCT_COLUMNS[1:]])
+LATEST_PRICE_ROW = ('SELECT %s AS keyProductId, %s AS keySellUnitId, %s AS price, %s AS referenceId, '
+                    '%s AS referenceType, %s AS contentHash')
+UPDATE_PRICES_SET = """ AS latest ON prices.keyProductId = latest.keyProductId
+               SET prices.keySellUnitId = latest.keySellUnitId, prices.price = latest.price,
+                   prices.referenceId = latest.referenceId, prices.referenceType = latest.referenceType,
+                   prices.contentHash = latest.contentHash"""
+
+
+def insert_prices_query(num_rows: int) -> str:
+    """Multi-row insert of prices"""
+    return INSERT_PRICES + values_clause(len(PRICE_COLUMNS), num_rows)
+
+
+def upsert_products_query(num_rows: int) -> str:
+    """Multi-row insert of products that updates the existing row on a duplicate keyProductId"""
+    return UPSERT_PRODUCTS + values_clause(len(PRODUCT_COLUMNS), num_rows) + UPSERT_PRODUCTS_UPDATES
+
+
+def update_prices_query(num_rows: int) -> str:
+    """Updates the prices of num_rows products, joined by keyProductId, in one statement"""
+    return 'UPDATE prices JOIN (' + ' UNION ALL '.join([LATEST_PRICE_ROW] * num_rows) + ')' + UPDATE_PRICES_SET
+
 
 class ProductResource(DatabaseBase):
     """
@@ -37,54 +136,21 @@ class ProductResource(DatabaseBase):
     # Insert the products in the 'Products' table. Used when Importing the data from the SQUIZZ organization / supplier
     def store_products(self, product_list: List[Product]):
 
-        insert_query = """INSERT INTO products (KeyProductId, Barcode, BarcodeInner, Description1, Description2, Description3, Description4, 
-                           InternalId, Brand, Height, Depth, Width, Weight, Volume, ProductCondition, IsPriceTaxInclusive, IsKitted, KeyTaxcodeId,
-                           StockQuantity, ProductName, KitProductsSetPrice, ProductCode, ProductSearchCode, StockLowQuantity, AverageCost, ProductDrop,
-                           PackQuantity, SupplierOrganizationId, KeySellUnitID)                       
-                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+        self.require_content_hash()
+        insert_query = f"""INSERT INTO products ({', '.join(PRODUCT_COLUMNS)})
+                           VALUES {values_clause(len(PRODUCT_COLUMNS), 1)}"""
 
         failed_to_store = []
 
         for product in product_list:
             try:
-                values = [
-                    product.keyProductID,
-                    product.barcode,
-                    product.barcodeInner,
-                    product.description1,
-                    product.description2,
-                    product.description3,
-                    product.description4,
-                    product.internalID,
-                    product.brand,
-                    product.height,
-                    product.depth,
-                    product.width,
-                    product.weight,
-                    product.volume,
-                    product.productCondition,
-                    product.isPriceTaxInclusive,
-                    product.isKitted,
-                    product.keyTaxcodeID,
-                    product.stockQuantity,
-                    product.name,
-                    product.kitProductsSetPrice,
-                    product.productCode,
-                    product.productSearchCode,
-                    product.stockLowQuantity,
-                    product.averageCost,
-                    product.drop,
-                    product.packQuantity,
-                    config.SUPPLIER_ORG_ID,
-                    product.keySellUnitID
-                ]
-
-                self.run_query(insert_query, values, True)
+                self.run_query(insert_query, product_values(product), True)
 
             except Exception as e:
                 logger.error("exception %s", e)
                 failed_to_store.append(product.keyProductID + "error: " + str(e))
 
+        count_cache.invalidate(Product.table_name())
         logger.info('completed store_products')
         result = {
             'status': "success",
@@ -100,46 +166,50 @@ class ProductResource(DatabaseBase):
     # the SQUIZZ organization / supplier
     # todo: (For SQ-Koala) we can't just add prices, we need to know the customer as well for which we are
     #  adding the price for now its only for single record (only 1 customer).
-    def store_prices(self, price_list: List[Price]):
-        insert_query = """INSERT INTO prices (KeyProductId, keySellUnitID, Price, ReferenceId, 
-                          ReferenceType, ProductId) 
-                          VALUES (%s, %s, %s, %s, %s, %s)"""
+    def store_prices(self, price_list: List[Price], batch_size=1000, key_map=None):
+        """
+        Stores prices with multi-row inserts, one commit per chunk. The id of
+        each price's product is looked up in a keyProductId -> id map loaded
+        once, prices of unknown products are skipped and reported as failed.
+        If a chunk fails, its prices are inserted one by one.
 
-        # Get the Product from the Products table, as we need to insert the record ID
-        # when adding the data to Price Table
-        search_query = "SELECT * FROM products WHERE keyProductID=%s"
+        Args:
+            price_list: list of Price objects created from data retrieved from SQUIZZ API
+            batch_size: max number of prices per statement
+            key_map: keyProductId -> products.id, loaded from the database if not given
+        """
+        self.require_content_hash()
+        if key_map is None:
+            key_map = self.product_key_map()
 
         failed_to_store = []
 
-        for price in price_list:
-            # First, search in the product table to check whether this product exists.
-            # If not, skip this record and continue. Otherwise, it may cause foreign key
-            # constraint issue
-            product_record = None
+        def rows():
+            for price in price_list:
+                # Skip the prices of products that do not exist. Otherwise, it may cause
+                # foreign key constraint issue
+                product_id = key_map.get(price.keyProductID)
+                if product_id is None:
+                    failed_to_store.append(price.keyProductID + " error:" + " product does not exist")
+                    continue
+                yield price, price_values(price) + [product_id]
+
+        for chunk in chunked(rows(), batch_size, self.packet_limit(), lambda row: row_size(row[1])):
             try:
-                product_record = self.run_query(search_query, price.keyProductID, False)
+                self.run_query(insert_prices_query(len(chunk)),
+                               [value for _, values in chunk for value in values], True)
+                continue
             except Exception as e:
-                logger.error('Exception occurred when searching for product record in store_product_level method. %s',
-                             e)
+                logger.error('Exception occurred when inserting a chunk of prices, retrying one by one %s', e)
 
-            if product_record is not None:
-                # Since we already checked the existence of the product, we could do the insertion.
+            for price, values in chunk:
                 try:
-                    values = [
-                        price.keyProductID,
-                        price.keySellUnitID,
-                        price.price,
-                        price.referenceID,
-                        price.referenceType,
-                        product_record[0]['id']
-                    ]
-                    self.run_query(insert_query, values, True)
+                    self.run_query(insert_prices_query(1), values, True)
                 except Exception as e:
-                    logger.error("Exception", e)
+                    logger.error("Exception %s", e)
                     failed_to_store.append(price.keyProductID + "error: " + str(e))
-            else:
-                failed_to_store.append(price.keyProductID + " error:" + " product does not exist")
 
+        count_cache.invalidate(Price.table_name())
         logger.info('completed store_prices')
         result = {
             'status': 'success',
@@ -150,6 +220,31 @@ class ProductResource(DatabaseBase):
         }
         return result
 
+    def require_content_hash(self):
+        """
+        Raise SchemaOutdated unless migration 0002 added the contentHash
+        columns, so a sync fails with a clear message before writing anything
+        """
+        global _content_hash_checked
+        if _content_hash_checked:
+            return
+        records = self.run_query(f"""SELECT TABLE_NAME AS tableName FROM information_schema.COLUMNS
+                                     WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME = 'contentHash'
+                                     AND TABLE_NAME IN ({', '.join(['%s'] * len(CONTENT_HASH_TABLES))})""",
+                                 list(CONTENT_HASH_TABLES), False) or []
+        missing = set(CONTENT_HASH_TABLES) - {record['tableName'].lower() for record in records}
+        if missing:
+            raise SchemaOutdated('0002_content_hash', sorted(missing))
+        _content_hash_checked = True
+
+    def product_key_map(self) -> dict:
+        """Returns keyProductId -> id of every product"""
+        key_map = {}
+        for rows in self.iter_query('SELECT keyProductId, id FROM products', [], 5000):
+            for row in rows:
+                key_map[row['keyProductId']] = row['id']
+        return key_map
+
     def get_product_by_barcode(self, barcode):
 
         search_query = """SELECT products.id, products.barcode, products.productName, products.keyTaxcodeID,
@@ -162,6 +257,76 @@ class ProductResource(DatabaseBase):
             return None
         return product_record[0]
 
+    def get_products_by_barcodes(self, barcodes: list) -> dict:
+        """
+        Retrieve the products having any of the given barcodes, with their
+        price and images, in two queries whatever the number of barcodes:
+        the priced products with their effective price (the contract price
+        when they have several, see assign_price_and_images_to_product), then
+        the images of the products kept
+
+        :param barcodes: list of barcodes
+        :return: barcode -> Product, for the barcodes found. Like get_product_by_barcode,
+                 a product without a price is not found. The priced product with
+                 the lowest id is kept when several share a barcode
+        """
+        barcodes = list(dict.fromkeys(barcodes))
+        if not barcodes:
+            return {}
+        query = f"""SELECT * FROM (
+                        SELECT products.*,
+                            (SELECT price FROM prices WHERE prices.productId = products.id
+                             ORDER BY referenceType DESC LIMIT 1) AS effectivePrice
+                        FROM products WHERE products.barcode IN ({', '.join(['%s'] * len(barcodes))})
+                    ) AS candidates
+                    WHERE effectivePrice IS NOT NULL ORDER BY id"""
+        records = self.run_query(query, barcodes, False) or []
+
+        products = {}
+        for record in records:
+            price = record.pop('effectivePrice')
+            if record['barcode'] not in products:
+                product = SR.to_model(Product, record)
+                product.price = float(price)
+                products[product.barcode] = product
+        self.assign_images_to_product(list(products.values()))
+        return products
+
+    def get_product_detail(self, identifier, identifierType):
+        """
+        Retrieve a product with everything a scanner shows, in two queries
+        on this connection: the product with its effective price (the
+        contract price when it has several, see assign_price_and_images_to_product)
+        and its metadata, then all its images including the 3D model.
+
+        :param identifier: the barcode or product code
+        :param identifierType: 'barcode' or 'productCode'
+        :return: (Product with price and imageList, meta_json_string or None),
+                 or None if there is no such product
+        """
+        if identifierType not in SEARCHABLE_IDENTIFIERS:
+            raise IncorrectDataType('identifierType')
+
+        product_query = f"""SELECT products.*,
+                                (SELECT price FROM prices WHERE prices.productId = products.id
+                                 ORDER BY referenceType DESC LIMIT 1) AS effectivePrice,
+                                (SELECT meta_json_string FROM model_metadata WHERE model_metadata.product_code = products.productCode
+                                 ORDER BY model_metadata.id DESC LIMIT 1) AS metaJsonString
+                            FROM products WHERE products.{identifierType} = %s
+                            ORDER BY products.id LIMIT 1"""
+        records = self.run_query(product_query, [identifier], False)
+        if records is None:
+            return None
+        record = records[0]
+        price = record.pop('effectivePrice')
+        meta_json_string = record.pop('metaJsonString')
+
+        product = SR.to_model(Product, record)
+        product.price = None if price is None else float(price)
+        images = self.run_query(f'SELECT * FROM {Image.table_name()} WHERE productId = %s ORDER BY id', [product.id], False)
+        product.imageList = [SR.to_model(Image, image) for image in images or []]
+        return product, meta_json_string
+
     def get_product_by_product_code(self, productCode):
         search_query = """SELECT products.id, products.barcode, products.productCode, products.productName,
                           prices.keyProductID, prices.price, products.description1, products.description2, products.keyTaxcodeID, products.stockQuantity
@@ -204,100 +369,97 @@ class ProductResource(DatabaseBase):
         image_records = self.run_query(search_image_query, values, False)
         return image_records
 
+    def product_hashes(self, keys: list) -> dict:
+        """Returns keyProductId -> contentHash of the stored products among keys"""
+        if not keys:
+            return {}
+        records = self.run_query(f"SELECT keyProductId, contentHash FROM products WHERE keyProductId IN "
+                                 f"({', '.join(['%s'] * len(keys))})", keys, False)
+        return {} if records is None else {record['keyProductId']: record['contentHash'] for record in records}
+
+    def price_hashes(self, keys: list) -> dict:
+        """Returns keyProductId -> contentHash of the stored prices among keys"""
+        if not keys:
+            return {}
+        records = self.run_query(f"SELECT keyProductId, contentHash FROM prices WHERE keyProductId IN "
+                                 f"({', '.join(['%s'] * len(keys))})", keys, False)
+        return {} if records is None else {record['keyProductId']: record['contentHash'] for record in records}
+
     # This method is used to update the products that are stored in the database. Updated product infromation is fetched
     # from the SQUIZZ API.
-    def update_products(self, product_list: List[Product]):
+    def update_products(self, product_list: Iterable[Product], batch_size=1000):
         """
         Takes as input the retrieved product data from SQUIZZ API, then
         synchronises the data with the current records stored in the database.
-        If they are not identical, it will update the product information 
-        to the latest one.
+        The products are read batch_size at a time, and the stored contentHash
+        of a batch is fetched with one query. Only new products and products
+        whose hash changed are upserted, with INSERT ... ON DUPLICATE KEY UPDATE
+        on the unique keyProductId, one commit per chunk. If a chunk fails,
+        its products are upserted one by one so failures are reported per product.
+
+        Stored products that were not retrieved are counted as retained, they
+        are not deleted as orders, prices and images still refer to them.
+        Only the retrieved keys are kept across batches, the stored products
+        are counted with a streamed scan.
 
         Args:
-            product_list: list of Product objects created from data retrieved from SQUIZZ API
+            product_list: Product objects created from data retrieved from SQUIZZ API
+            batch_size: max number of products per statement
         """
-        value_not_inserted = 0
-        value_inserted = 0
-
-        # the primary keys of the product table is 'id' which is automatically generated by local database, can not
-        # included in the json_value. Therefore, we use the 'keyProductID' to do the query
+        self.require_content_hash()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
         failed_to_store = []
-        for product in product_list:
-            search_query = "SELECT * FROM products WHERE keyProductID = %s"
-            result = None
-            try:
-                # Will always return 1 result as the there is a uniqueness constraint on the KeyProductId column
-                search_result = self.run_query(search_query, product.keyProductID, False)
-                result = search_result[0]
-            except Exception as e:
-                value_not_inserted += 1
-                logger.error('Exception occurred when searching for record in update product session', e)
-                failed_to_store.append(product.keyProductID + " error:" + " product does not exist")
-
-            if not result:
-                logger.error('Got no corresponding record, insert a new record.')
-
-                # Pass the result to the Store_product method and it will add the entry to the database
-                self.store_products([product])
-                value_inserted += 1
-            else:
-                latest_record = [
-                    product.barcode,
-                    product.barcodeInner,
-                    product.description1,
-                    product.description2,
-                    product.description3,
-                    product.description4,
-                    product.internalID,
-                    product.brand,
-                    product.height,
-                    product.depth,
-                    product.width,
-                    product.weight,
-                    product.volume,
-                    product.productCondition,
-                    product.isPriceTaxInclusive,
-                    product.isKitted,
-                    product.keyTaxcodeID,
-                    product.stockQuantity,
-                    product.name,
-                    product.kitProductsSetPrice,
-                    product.productCode,
-                    product.productSearchCode,
-                    product.stockLowQuantity,
-                    product.averageCost,
-                    product.drop,
-                    product.packQuantity,
-                    config.SUPPLIER_ORG_ID,
-                    product.keySellUnitID,
-                    product.keyProductID
-                ]
-
-                # We are going to update entire product. Since, we are not using ORM, this is ideal way
-                # needs to be updated or not. So to avoid loss of data, just update the entire record
-                # Since the Id is not auto-incremented, we won't update that, but update other things.
-                update_query = """ UPDATE products SET Barcode = %s, BarcodeInner = %s, Description1  = %s, 
-                                    Description2 = %s, Description3 = %s, Description4 = %s, InternalId = %s, Brand = %s, 
-                                    Height = %s, Depth = %s, Width = %s, Weight = %s, Volume = %s, ProductCondition = %s, 
-                                    IsPriceTaxInclusive = %s, IsKitted = %s, KeyTaxcodeId = %s, StockQuantity = %s, ProductName = %s, 
-                                    KitProductsSetPrice = %s, ProductCode = %s, ProductSearchCode = %s, StockLowQuantity = %s, 
-                                    AverageCost = %s, ProductDrop = %s, PackQuantity = %s, SupplierOrganizationId = %s, KeySellUnitID = %s
-                                    WHERE keyProductID = %s"""
+        retrieved = set()
+
+        for batch in chunked(product_list, batch_size):
+            # The last record retrieved for a product wins
+            latest = {}
+            for product in batch:
+                latest[product.keyProductID] = (product, product_values(product))
+            retrieved.update(latest)
+
+            stored = self.product_hashes(list(latest))
+            rows = []
+            for key, (product, values) in latest.items():
+                if key not in stored:
+                    rows.append((product, values, 'inserted'))
+                elif stored[key] != values[-1]:
+                    rows.append((product, values, 'updated'))
+                else:
+                    counts['unchanged'] += 1
 
+            for chunk in chunked(rows, batch_size, self.packet_limit(), lambda row: row_size(row[1])):
                 try:
-                    self.run_query(update_query, latest_record, True)
-                    value_inserted += 1
+                    self.run_query(upsert_products_query(len(chunk)),
+                                   [value for _, values, _ in chunk for value in values], True)
+                    for _, _, change in chunk:
+                        counts[change] += 1
+                    continue
                 except Exception as e:
-                    self.connection.rollback()
-                    logger.error('Exception occurred when updating product table', e)
-                    value_not_inserted += 1
-                    failed_to_store.append(
-                        product.keyProductID + " error:" + " error occurred while updating: " + str(e))
+                    logger.error('Exception occurred when upserting a chunk of products, retrying one by one %s', e)
+
+                for product, values, change in chunk:
+                    try:
+                        self.run_query(upsert_products_query(1), values, True)
+                        counts[change] += 1
+                    except Exception as e:
+                        logger.error('Exception occurred when updating product table %s', e)
+                        failed_to_store.append(
+                            product.keyProductID + " error:" + " error occurred while updating: " + str(e))
+
+        retained = 0
+        for records in self.iter_query('SELECT keyProductId FROM products', [], 5000):
+            retained += sum(1 for record in records if record['keyProductId'] not in retrieved)
 
         self.connection.close()
-        logger.info('This is the value updated: %d' % value_inserted)
-        logger.info('This is the value not updated: %d' % value_not_inserted)
-        result = {'status': "success", 'data': {'failed': failed_to_store}, 'message': "successfully updated products"}
+        if counts['inserted'] or counts['updated']:
+            count_cache.invalidate(Product.table_name())
+        logger.info('Products synchronized: %s, not updated: %d, retained: %d', counts, len(failed_to_store), retained)
+        result = {
+            'status': "success",
+            'data': dict(counts, deleted=0, retained=retained, failed=failed_to_store),
+            'message': "successfully updated products"
+        }
         logger.info('Successfully synchronized latest products data from the SQUIZZ API')
         return result
 
@@ -305,90 +467,175 @@ class ProductResource(DatabaseBase):
     # The price information is fetched from the SQUIZZ API.
     # todo: we can't just update the price, we need to know the customer as well for which we are chaning the price
     #  for now its only for single record.
-    def update_prices(self, price_list: List[Price]):
+    def update_prices(self, price_list: Iterable[Price], batch_size=1000):
         """
-        Updates the 'price_level' table in the database. It compares the 
-        retrieved price data from the SQUIZZ API with data in the application
-        database. If they are identical, it only updates datetime. otherwise, 
-        the entire record will be updated.
+        Updates the 'prices' table in the database with the retrieved price
+        data from the SQUIZZ API. price_list is consumed batch_size prices
+        at a time, and the stored contentHash of a batch is fetched with one
+        query: prices of products that have no price yet are stored, prices
+        whose hash changed are updated in chunks by keyProductId, one
+        statement and one commit per chunk, and unchanged prices are not
+        written. Only the retrieved keys are kept across batches; once
+        price_list is exhausted, the stored prices are scanned and the ones
+        that were not retrieved are deleted.
 
         Args:
-            price_list: list of Price objects created from data retrieved from SQUIZZ API
+            price_list: Price objects created from data retrieved from SQUIZZ API
+            batch_size: max number of prices per statement
         """
+        self.require_content_hash()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
         failed_to_store = []
-        for price in price_list:
-            search_query = "SELECT * FROM prices WHERE keyProductID = %s"
-            try:
-                # todo: this will not be a single result, if we are talking about pricing for multiple customers
-                result_all = self.run_query(search_query, price.keyProductID, False)
-
-                # Call the method to add the price in the table if it doesn't exit
-                # Note: this will only update the price if the product exists in the first place.
-                if result_all is None:
-                    self.store_prices([price])
+        retrieved = set()
+        key_map = None
+
+        for batch in chunked(price_list, batch_size):
+            # The last price retrieved for a product wins, as it did when updating them one by one.
+            # Batches are applied in order, so a later batch overrides an earlier one
+            latest = {}
+            for price in batch:
+                latest[price.keyProductID] = (price, price_values(price))
+            retrieved.update(latest)
+
+            # A failed read must fail the sync: prices have no unique key, an empty map
+            # would insert the prices of the batch again
+            stored = self.price_hashes(list(latest))
+
+            # Call the method to add the price in the table if it doesn't exit
+            # Note: this will only add the price if the product exists in the first place.
+            new_prices = [price for key, (price, _) in latest.items() if key not in stored]
+            if new_prices:
+                if key_map is None:
+                    key_map = self.product_key_map()
+                failed = self.store_prices(new_prices, batch_size, key_map)['data']['failed']
+                failed_to_store += failed
+                counts['inserted'] += len(new_prices) - len(failed)
+
+            # todo: this will not be a single result, if we are talking about pricing for multiple customers
+            rows = []
+            for key, (price, values) in latest.items():
+                if key not in stored:
+                    continue
+                if stored[key] != values[-1]:
+                    rows.append((price, values))
                 else:
-                    # we are not going to update the KeyProductID. So don't add that
-                    latest_values = [
-                        price.keySellUnitID,
-                        price.price,
-                        price.referenceID,
-                        price.referenceType,
-                        price.keyProductID
-                    ]
-
-                    update_query = """UPDATE prices SET keySellUnitID = %s, Price = %s, ReferenceId = %s, 
-                                      ReferenceType = %s WHERE keyProductID = %s"""
+                    counts['unchanged'] += 1
+
+            for chunk in chunked(rows, batch_size, self.packet_limit(), lambda row: row_size(row[1])):
+                try:
+                    self.run_query(update_prices_query(len(chunk)), [value for _, values in chunk for value in values], True)
+                    counts['updated'] += len(chunk)
+                    continue
+                except Exception as e:
+                    logger.error('Exception occurred when updating a chunk of prices, retrying one by one %s', e)
+
+                for price, values in chunk:
                     try:
-                        self.run_query(update_query, latest_values, True)
+                        self.run_query(update_prices_query(1), values, True)
+                        counts['updated'] += 1
                     except Exception as e:
-                        self.connection.rollback()
-                        logger.error('Exception occurred when updating the latest price info', e)
+                        logger.error('Exception occurred when updating the latest price info %s', e)
                         failed_to_store.append(price.keyProductID + "error:" + "failed to update price")
 
-            except Exception as e:
-                logger.error('Exception occurred when search price in price_level', e)
-                failed_to_store.append(price.keyProductID + "error:" + "failed to update price")
+        # An empty retrieval more likely means a problem upstream than a catalog without prices
+        if retrieved:
+            # The deletes wait for the scan, the connection is busy until it is exhausted
+            missing = {}
+            for records in self.iter_query('SELECT keyProductId FROM prices', [], 5000):
+                for record in records:
+                    if record['keyProductId'] not in retrieved:
+                        missing[record['keyProductId']] = None
+            for chunk in chunked(missing, batch_size):
+                try:
+                    self.run_query(f"DELETE FROM prices WHERE keyProductId IN ({', '.join(['%s'] * len(chunk))})",
+                                   chunk, True)
+                    counts['deleted'] += self.cursor.rowcount
+                except Exception as e:
+                    logger.error('Exception occurred when deleting prices that were not retrieved %s', e)
+                    failed_to_store += [key + " error:" + " failed to delete price" for key in chunk]
+        else:
+            logger.warning('No prices retrieved, the stored prices are kept')
 
-        logger.info("Successfully updated 'price_level' table")
+        if counts['inserted'] or counts['updated'] or counts['deleted']:
+            count_cache.invalidate(Price.table_name())
+        logger.info("Successfully updated 'prices' table: %s", counts)
         result = {
             'status': "success",
             'message': "successfully updated product prices",
-            'data': {
-                'failed': failed_to_store
-            },
+            'data': dict(counts, failed=failed_to_store),
         }
         return result
 
-    def search_products(self, identifier, identifierType):
+    def search_products(self, identifier, identifierType, limit):
         """
         Retrieves a list of product codes (or barcodes) from the database
-        that are syntactially similar to the given identifier
+        that start with the given identifier
 
         Args:
             identifier: a potential product code or barcode
             identifierType: 'barcode' or 'productCode'
+            limit: maximum number of identifiers returned
         Returns:
             list of similar 'identifiers'
         """
+        if identifierType not in SEARCHABLE_IDENTIFIERS:
+            raise IncorrectDataType('identifierType')
 
-        query = f"SELECT {identifierType} FROM products WHERE {identifierType} LIKE '{identifier + '%'}'"
-        logger.debug(query)
-        similar = self.run_query(query, None, False)
+        # The identifier is a literal prefix, escape the LIKE wildcards
+        pattern = identifier.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = f"""SELECT DISTINCT {identifierType} FROM products WHERE {identifierType} LIKE %s
+                    ORDER BY {identifierType} LIMIT %s"""
+        similar = self.run_query(query, [pattern, limit], False)
 
         return None if not similar else similar
 
-    def list_products_by_category(self, category_id, page=None, page_size=None):
+    def category_product_ids(self) -> dict:
+        """Returns categoryId -> set of the ids of the products directly in that category"""
+        product_ids = defaultdict(set)
+        for rows in self.iter_query(f'SELECT categoryId, productId FROM {CateProd.table_name()}', [], 5000):
+            for row in rows:
+                product_ids[row['categoryId']].add(row['productId'])
+        return product_ids
+
+    def iter_identifiers(self, batch_size=5000):
+        """Streams the barcode and productCode of every product, in lists of at most batch_size rows"""
+        return self.iter_query('SELECT barcode, productCode FROM products', [], batch_size)
+
+    def count_products(self, category_id=None) -> int:
+        """Number of products in a category, or of all products, cached until the catalog is synced"""
+        if category_id is not None:
+            table = CateProd.table_name()
+            count_query = 'SELECT COUNT(DISTINCT productId) as count FROM categoryproducts WHERE categoryId = %s'
+            values = [category_id]
+        else:
+            table = Product.table_name()
+            count_query = 'SELECT COUNT(*) as count FROM products'
+            values = []
+
+        count = count_cache.get(table, category_id)
+        if count is None:
+            generation = count_cache.generation(table)
+            count = self.run_query(count_query, values, False)[0]['count']
+            count_cache.set(table, category_id, count, generation)
+        return count
+
+    def list_products_by_category(self, category_id, page=None, page_size=None, after=None, with_total=True):
+        """
+        List the products of a category, or all products.
+
+        Pages are either addressed by number with page (LIMIT offset, size),
+        or by an 'after' cursor returned as 'next' by the previous page, see
+        list_products_after. A cursor takes precedence over page.
+        """
+        if after is not None:
+            return self.list_products_after(category_id, after, page_size, with_total)
+
         count = 0
         if page is None:
             paging_str = ''
         else:
             paging_str = f'LIMIT {(page - 1) * page_size}, {page_size}'
-            if category_id is not None:
-                count_query = f'SELECT COUNT(DISTINCT productId) as count FROM categoryproducts\
-                                WHERE categoryId = {category_id}'
-            else:
-                count_query = f'SELECT COUNT(*) as count FROM products'
-            count = self.run_query(count_query, [], False)[0]['count']
+            count = self.count_products(category_id)
             total_pages = math.ceil(count / page_size)
             if total_pages == 0:
                 total_pages = 1
@@ -423,6 +670,93 @@ class ProductResource(DatabaseBase):
             # raise e
             raise OtherException(Product())
 
+    def list_products_after(self, category_id, after, page_size, with_total=False):
+        """
+        Keyset pagination: list the page_size products of a category (or all
+        products) whose id follows the one encoded in the 'after' cursor, in
+        id order. Each page is a single range scan however deep it is.
+
+        :param category_id: category filter, None for all products
+        :param after: cursor from the previous page's 'next', '' for the first page
+        :param page_size: page size
+        :param with_total: also count the matching products
+        :return {"page_items", "items", "next"[, "total_items", "total_pages"]},
+                "next" is None on the last page
+        """
+        last_id = decode_cursor(after, category_id)
+        if category_id is None:
+            prod_query = 'SELECT products.* FROM products WHERE products.id > %s ORDER BY products.id LIMIT %s'
+            values = [last_id, page_size + 1]
+        else:
+            prod_query = """SELECT products.* FROM products JOIN (
+                                SELECT DISTINCT productId FROM categoryproducts
+                                WHERE categoryId = %s AND productId > %s ORDER BY productId LIMIT %s
+                            ) AS page ON page.productId = products.id
+                            ORDER BY products.id"""
+            values = [category_id, last_id, page_size + 1]
+
+        try:
+            products = self.run_query(prod_query, values, False)
+            products = [] if products is None else products
+            items = [SR.to_model(Product, p) for p in products[:page_size]]
+        except Exception as e:
+            logger.error('Exception occurred when retrieving products by category %s', e)
+            raise OtherException(Product())
+
+        # One extra row was fetched to know whether there is a next page
+        result = {
+            "page_items": len(items),
+            "items": items,
+            "next": encode_cursor(items[-1].id, category_id) if len(products) > page_size else None
+        }
+        if with_total:
+            count = self.count_products(category_id)
+            result["total_items"] = count
+            result["total_pages"] = max(math.ceil(count / page_size), 1)
+        return result
+
+    def iter_products_by_category(self, category_id=None, batch_size=1000, model=Product):
+        """
+        Lazily yield the products of a category (or all products), read from
+        the server batch_size rows at a time. Pass model=CompactProduct to
+        get the compact representation.
+        """
+        if category_id is None:
+            prod_query = 'SELECT products.* FROM products'
+            values = []
+        else:
+            prod_query = """SELECT products.* FROM products WHERE products.id IN (
+                            SELECT productId FROM categoryproducts WHERE categoryId = %s)"""
+            values = [category_id]
+
+        for rows in self.iter_query(prod_query, values, batch_size):
+            for row in rows:
+                yield SR.to_model(model, row)
+
+    def assign_categories_to_product(self, products: list):
+        """
+        Retrieve the categories of products, set as a list of
+        {'id', 'keyCategoryID', 'name'} dicts in categoryList
+
+        :param products: list of products
+        :return: None
+        """
+        if not products:
+            return
+        query = f"""SELECT categoryproducts.productId, categories.id, categories.keyCategoryId, categories.categoryName
+                    FROM {CateProd.table_name()} categoryproducts
+                    JOIN {Category.table_name()} categories ON categories.id = categoryproducts.categoryId
+                    WHERE categoryproducts.productId IN ({', '.join(['%s'] * len(products))})
+                    ORDER BY categories.id"""
+        records = self.run_query(query, [product.id for product in products], False) or []
+
+        category_dict = defaultdict(list)
+        for record in records:
+            category_dict[record['productId']].append(
+                {'id': record['id'], 'keyCategoryID': record['keyCategoryId'], 'name': record['categoryName']})
+        for product in products:
+            product.categoryList = category_dict.get(product.id, [])
+
     def assign_price_and_images_to_product(self, products: list):
         """
         Retrieve prices for products by product id
@@ -432,35 +766,46 @@ class ProductResource(DatabaseBase):
         :param products: list of products
         :return: None
         """
+        if not products:
+            return
         product_ids = ','.join([str(p.id) for p in products])
         price_query = f'SELECT productId, price, referenceType FROM {Price.table_name()} \
                     WHERE productId IN ({product_ids})\
                     ORDER BY referenceType DESC'
 
+        # run_query returns None when no row matched
+        prices = self.run_query(price_query, [], False) or []
+        price_dict = {}
+
+        # Pair productId, price
+        for price in prices:
+            if price['productId'] not in price_dict:
+                price_dict[price['productId']] = float(price['price'])
+
+        for product in products:
+            product.price = price_dict.get(product.id, None)
+        self.assign_images_to_product(products)
+
+    def assign_images_to_product(self, products: list):
+        """
+        Retrieve the images of products by product id
+
+        :param products: list of products
+        :return: None
+        """
+        if not products:
+            return
+        product_ids = ','.join([str(p.id) for p in products])
         image_query = f'SELECT * FROM {Image.table_name()} \
                     WHERE productId IN ({product_ids})'
 
-        try:
-            prices = self.run_query(price_query, [], False)
-            images = self.run_query(image_query, [], False)
-            price_dict = {}
-            image_dict = defaultdict(list)
-
-            # Pair productId, price
-            for price in prices:
-                if price['productId'] not in price_dict:
-                    price_dict[price['productId']] = float(price['price'])
-
-            # Pair productId, images
-            if images is not None:
-                for image in images:
-                    image_obj = SR.to_model(Image, image)
-                    image_dict[image['productId']].append(image_obj)
-
-            for product in products:
-                product.price = price_dict.get(product.id, None)
-                product.imageList = image_dict.get(product.id, [])
+        images = self.run_query(image_query, [], False) or []
+        image_dict = defaultdict(list)
 
-        except Exception as e:
-            logger.error('Exception occurred when retrieving prices for products %s', e)
-        pass
+        # Pair productId, images
+        for image in images:
+            image_obj = SR.to_model(Image, image)
+            image_dict[image['productId']].append(image_obj)
+
+        for product in products:
+            product.imageList = image_dict.get(product.id, [])
@@ -2,16 +2,137 @@ import logging
 import datetime
 
 import math
+from decimal import Decimal
+from functools import lru_cache
 from pymysql import IntegrityError
 from werkzeug.exceptions import HTTPException
-from app.Resource.DatabaseBase import DatabaseBase
+from app.Resource.DatabaseBase import DatabaseBase, chunked, row_size, values_clause
 from app.Exception.exceptions import *
+from app.Util.Pagination import encode_cursor, decode_cursor
+from app.Util.Cache import count_cache
+from app.Model.Model import Model
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 
+class Converter:
+    """
+    Row <-> model conversion for one Model class, compiled once from its
+    fields_mapping() and default attributes. Use converter(cls) to get the
+    cached instance.
+
+    load() builds a model from a database row in a single pass, applying
+    the same coercions as Model.__init__: Decimal to float and rstrip of
+    codes. dump() returns the column -> value dict of a model.
+    """
+
+    # Attributes Model.__init__ strips trailing spaces from
+    STRIPPED = ('productCode', 'keyProductId')
+
+    def __init__(self, cls):
+        mapping = cls.fields_mapping()
+        prototype = cls(None)
+        self.cls = cls
+        self.defaults = prototype.__dict__.copy()
+        # Mutable defaults (e.g. Product.imageList) must not be shared between instances
+        self.mutable = tuple((attr, type(value)) for attr, value in self.defaults.items()
+                             if isinstance(value, (list, dict, set)))
+        self.columns = {column: attr for column, attr in mapping.items() if attr in self.defaults}
+        self.stripped = frozenset(attr for attr in self.STRIPPED if attr in self.defaults)
+        self.fields = tuple((attr, mapping[attr]) for attr in self.defaults if attr in mapping)
+        self.mapping = mapping
+        self.has_hook = type(prototype).after_load is not Model.after_load
+        # Compact models have no instance dict, see app.Model.CompactModel
+        self.from_values = getattr(cls, 'from_values', None)
+
+    def load(self, row):
+        values = self.defaults.copy()
+        for attr, factory in self.mutable:
+            values[attr] = factory(values[attr])
+
+        columns = self.columns
+        stripped = self.stripped
+        for column, value in row.items():
+            attr = columns.get(column)
+            if attr is None:
+                continue
+            if value.__class__ is Decimal:
+                value = float(value)
+            elif attr in stripped and value is not None:
+                value = value.rstrip()
+            values[attr] = value
+
+        if self.from_values is not None:
+            obj = self.from_values(values)
+        else:
+            obj = self.cls.__new__(self.cls)
+            obj.__dict__ = values
+        if self.has_hook:
+            obj.after_load()
+        return obj
+
+    def dump(self, obj):
+        obj_dict = obj.__dict__
+        if len(obj_dict) != len(self.defaults):
+            # Attributes were added or removed after construction, fall back to a full scan
+            mapping = self.mapping
+            return {mapping[key]: value for key, value in obj_dict.items() if key in mapping}
+        return {column: obj_dict[attr] for attr, column in self.fields if attr in obj_dict}
+
+
+_converters = {}
+
+
+def converter(cls) -> Converter:
+    """Return the compiled Converter of a Model class, building it on first use"""
+    conv = _converters.get(cls)
+    if conv is None:
+        conv = _converters[cls] = Converter(cls)
+    return conv
+
+
+@lru_cache(maxsize=128)
+def statement(kind: str, table: str, fields: tuple = ()) -> str:
+    """
+    SQL generated for a model table and column set, built once and cached.
+    Every value, including ids and paging, is a %s parameter, so the
+    database only ever sees a small set of stable statement texts, which
+    also makes them suitable for server-side prepared statements with a
+    driver that supports them.
+
+    :param kind: 'select_by_id', 'delete_by_id', 'insert_into', 'insert', 'update', 'find' or 'find_paged'
+    :param table: table name
+    :param fields: tuple of columns inserted, updated or matched
+    """
+    if kind == 'select_by_id':
+        return f'SELECT * FROM {table} WHERE id=%s'
+    if kind == 'delete_by_id':
+        return f'DELETE FROM {table} WHERE id=%s'
+    if kind == 'insert_into':
+        return f"INSERT into {table} ({','.join(fields)}) VALUES "
+    if kind == 'insert':
+        return statement('insert_into', table, fields) + values_clause(len(fields), 1)
+    if kind == 'update':
+        sets = ','.join([f'{field}=%s' for field in fields])
+        return f'UPDATE {table} SET {sets} WHERE id=%s'
+    if kind in ('find', 'find_paged'):
+        where_clause = 'WHERE ' + ' AND '.join([f'{field}=%s' for field in fields])
+        paging_str = 'LIMIT %s, %s' if kind == 'find_paged' else ''
+        return f'SELECT * FROM {table} {where_clause} {paging_str}'
+    raise ValueError(f'Unknown statement kind {kind}')
+
+
+def insert_statement(table: str, fields: tuple, num_rows: int) -> str:
+    """
+    Multi-row insert. Chunks are sized by bytes, so their row counts
+    rarely repeat: only the column list is cached, the VALUES clause is
+    built per call.
+    """
+    return statement('insert_into', table, fields) + values_clause(len(fields), num_rows)
+
+
 class SimpleModelResource(DatabaseBase):
     """
     A subclass of DatabaseBase, responsible for handling database
@@ -41,23 +162,18 @@ class SimpleModelResource(DatabaseBase):
         :param obj: Model obj
         :return: field_value_dict -> dict
         """
-        fields_mapping = obj.fields_mapping()
-        obj_dict = obj.__dict__.copy()
-        field_value_dict = {}
-        for key in obj_dict:
-            if key in fields_mapping:
-                field_value_dict[fields_mapping[key]] = obj_dict[key]
-
-        return field_value_dict
+        return converter(type(obj)).dump(obj)
 
     @staticmethod
     def to_model(cls, record_dict):
-        fields_mapping = cls.fields_mapping()
-        obj_dict = {}
-        for key in record_dict:
-            if key in fields_mapping:
-                obj_dict[fields_mapping[key]] = record_dict[key]
-        return cls(obj_dict)
+        """
+        Build a Model obj of the given class from a database record
+
+        :param cls: Model class
+        :param record_dict: column -> value dict
+        :return: Model obj
+        """
+        return converter(cls).load(record_dict)
 
     def get_one_by_id(self, obj):
         """
@@ -66,8 +182,7 @@ class SimpleModelResource(DatabaseBase):
         """
         cls = type(obj)
         table = obj.table_name()
-        query = f'SELECT * FROM {table} WHERE id=%s'
-        ret = self.run_query(query, [obj.id], False)
+        ret = self.run_query(statement('select_by_id', table), [obj.id], False)
         if ret is None:
             logger.error(f'Record not found in table {table}')
             raise NotFound(obj)
@@ -75,8 +190,16 @@ class SimpleModelResource(DatabaseBase):
             ret_obj = self.to_model(cls, ret[0])
             return ret_obj
 
-    def list_all(self, cls, fields=None, page=None, page_size=20):
-        """return all records by the given class"""
+    def list_all(self, cls, fields=None, page=None, page_size=20, after=None, with_total=True):
+        """
+        return all records by the given class
+
+        Pages are either addressed by number with page, or by an 'after'
+        cursor returned as 'next' by the previous page, see list_after.
+        """
+        if after is not None:
+            return self.list_after(cls, after, fields, page_size, with_total)
+
         table = cls.table_name()
 
         if fields is None:
@@ -88,8 +211,7 @@ class SimpleModelResource(DatabaseBase):
             paging_str = ''
         else:
             paging_str = f'LIMIT {(page - 1) * page_size}, {page_size}'
-            count_query = f'SELECT COUNT(*) AS count FROM {table}'
-            count = self.run_query(count_query, [], False)[0]['count']
+            count = self.count(cls)
             total_pages = math.ceil(count / page_size)
             if total_pages == 0:
                 total_pages = 1
@@ -110,6 +232,57 @@ class SimpleModelResource(DatabaseBase):
                 "items": obj_list
             }
 
+    def count(self, cls):
+        """Number of records of the given class, cached until the table is written to"""
+        table = cls.table_name()
+        count = count_cache.get(table)
+        if count is None:
+            generation = count_cache.generation(table)
+            count = self.run_query(f'SELECT COUNT(*) AS count FROM {table}', [], False)[0]['count']
+            count_cache.set(table, None, count, generation)
+        return count
+
+    def list_after(self, cls, after, fields=None, page_size=20, with_total=False):
+        """
+        Keyset pagination: return the page_size records following the id
+        encoded in the 'after' cursor, in id order. Fields must include id.
+
+        :return {"page_items", "items", "next"[, "total_items", "total_pages"]},
+                "next" is None on the last page
+        """
+        table = cls.table_name()
+        fields_str = '*' if fields is None else ','.join(fields)
+        last_id = decode_cursor(after)
+
+        query = f'SELECT {fields_str} FROM {table} WHERE id > %s ORDER BY id LIMIT %s'
+        obj_dict_list = self.run_query(query, [last_id, page_size + 1], False)
+        obj_dict_list = [] if obj_dict_list is None else obj_dict_list
+        obj_list = [self.to_model(cls, obj_dict) for obj_dict in obj_dict_list[:page_size]]
+
+        # One extra row was fetched to know whether there is a next page
+        result = {
+            "page_items": len(obj_list), "items": obj_list,
+            "next": encode_cursor(obj_list[-1].id) if len(obj_dict_list) > page_size else None
+        }
+        if with_total:
+            count = self.count(cls)
+            result["total_items"] = count
+            result["total_pages"] = max(math.ceil(count / page_size), 1)
+        return result
+
+    def iter_all(self, cls, fields=None, batch_size=1000, as_model=True):
+        """
+        Lazily yield all records of the given class, read from the server
+        batch_size rows at a time, so memory stays flat however big the
+        table is. Yields raw row dicts instead of models if as_model is False.
+        """
+        table = cls.table_name()
+        fields_str = '*' if fields is None else ','.join(fields)
+        query = f'SELECT {fields_str} FROM {table}'
+        for rows in self.iter_query(query, [], batch_size):
+            for row in rows:
+                yield self.to_model(cls, row) if as_model else row
+
     def insert(self, obj, commit=True):
         """
         Save current obj as an new instance into the database
@@ -119,12 +292,11 @@ class SimpleModelResource(DatabaseBase):
         record_dict = self.to_dict(obj)
         del record_dict['id']
 
-        fields_str = ','.join(record_dict.keys())
+        query = statement('insert', table, tuple(record_dict.keys()))
         values = list(record_dict.values())
-        place_holders = ('%s,' * len(values))[:-1]
-        query = f"INSERT into {table} ({fields_str}) VALUES ({place_holders})"
         try:
             self.run_query(query, values, commit)
+            count_cache.invalidate(table)
             obj.id = self.cursor.lastrowid
             return obj
         except IntegrityError as e:
@@ -139,33 +311,69 @@ class SimpleModelResource(DatabaseBase):
             logger.error(f'Create record for table {table} failed: {str(e)}')
             raise OtherException(obj)
 
-    # TODO to finalise
     def batch_insert(self, obj_list, batch_size=5000, commit=True):
-        """Insert records one by one for now"""
+        """
+        Save objs as new instances with multi-row INSERT statements, chunked
+        by batch_size and by the server's max_allowed_packet. A chunk that
+        fails is split in halves until the failing rows are isolated, so
+        failures are still reported per obj. The generated ids are assigned
+        back to the objs.
+
+        :param obj_list: objs of the same Model class
+        :param batch_size: max number of rows per statement
+        :param commit: commit after each chunk
+        :return: {'total', 'success', 'failed', 'failed_objs'}
+        """
         total = len(obj_list)
         if total == 0:
             return
         table = obj_list[0].table_name()
-        success = 0
-        failed = 0
-        failed_list = []
+        result = {
+            'total': total,
+            'success': 0,
+            'failed': 0,
+            'failed_objs': []
+        }
+
+        # Group rows by column set, objs of one class normally share a single one
+        groups = {}
         for obj in obj_list:
-            try:
-                self.insert(obj, commit=commit)
-            except Exception as e:
-                failed += 1
-                failed_list.append(obj)
+            record_dict = self.to_dict(obj)
+            del record_dict['id']
+            groups.setdefault(tuple(record_dict.keys()), []).append((obj, list(record_dict.values())))
+
+        max_bytes = self.packet_limit()
+        for fields, rows in groups.items():
+            for chunk in chunked(rows, batch_size, max_bytes, lambda row: row_size(row[1])):
+                self._insert_chunk(table, fields, chunk, commit, result)
+
+        logger.info(f"Batch insert into table '{table}', num of success [{result['success']}/{total}]")
+        return result
+
+    def _insert_chunk(self, table, fields, chunk, commit, result):
+        """Insert one chunk of (obj, values) rows, bisecting it on failure"""
+        query = insert_statement(table, fields, len(chunk))
+        values = [value for _, row in chunk for value in row]
+        try:
+            self.run_query(query, values, commit)
+        except Exception as e:
+            if len(chunk) == 1:
+                result['failed'] += 1
+                result['failed_objs'].append(chunk[0][0])
                 logger.error(f'Create record for table {table} failed: {str(e)}')
-            else:
-                success += 1
+                return
+            half = len(chunk) // 2
+            self._insert_chunk(table, fields, chunk[:half], commit, result)
+            self._insert_chunk(table, fields, chunk[half:], commit, result)
+            return
 
-        logger.info(f"Batch insert into table '{table}', num of success [{success}/{total}]")
-        return {
-            'total': total,
-            'success': success,
-            'failed': failed,
-            'failed_objs': failed_list
-        }
+        # A multi-row insert reserves consecutive ids starting from lastrowid
+        first_id = self.cursor.lastrowid
+        step = self.server_variables()['auto_increment_increment']
+        for idx, (obj, _) in enumerate(chunk):
+            obj.id = first_id + idx * step
+        result['success'] += len(chunk)
+        count_cache.invalidate(table)
 
     def update(self, obj, commit=True):
         """
@@ -177,10 +385,8 @@ class SimpleModelResource(DatabaseBase):
         record_dict = self.to_dict(obj)
         del record_dict['id']
 
-        fields = record_dict.keys()
-        values = list(record_dict.values())
-        sets = ','.join([f'{field}=%s' for field in fields])
-        query = f"UPDATE {table} SET {sets} WHERE id={obj.id}"
+        query = statement('update', table, tuple(record_dict.keys()))
+        values = list(record_dict.values()) + [obj.id]
         try:
             self.run_query(query, values, commit)
         except IntegrityError as e:
@@ -202,8 +408,8 @@ class SimpleModelResource(DatabaseBase):
         """
         obj = self.get_one_by_id(obj)
         table = obj.table_name()
-        query = f'DELETE FROM {table} WHERE id=%s'
-        self.run_query(query, [obj.id], commit)
+        self.run_query(statement('delete_by_id', table), [obj.id], commit)
+        count_cache.invalidate(table)
 
     def find_all(self, obj, page=None, page_size=20):
         """
@@ -225,18 +431,15 @@ class SimpleModelResource(DatabaseBase):
         if len(fv_dict) == 0:
             return []
 
-        fields = fv_dict.keys()
+        fields = tuple(fv_dict.keys())
         values = list(fv_dict.values())
 
-        where_clause = 'WHERE ' + ' AND '.join(
-            [f'{field}=%s' for field in fields]
-        )
         if page is None:
-            paging_str = ''
+            query = statement('find', table, fields)
         else:
-            paging_str = f'LIMIT {(page - 1) * page_size}, {page_size}'
+            query = statement('find_paged', table, fields)
+            values += [(page - 1) * page_size, page_size]
 
-        query = f'SELECT * FROM {table} {where_clause} {paging_str}'
         try:
             ret_list = self.run_query(query, values, False)
             if ret_list is None:
@@ -269,6 +472,7 @@ class SimpleModelResource(DatabaseBase):
         """Clear tables"""
         try:
             self.run_query(f'DELETE FROM {cls.table_name()}', [], commit)
+            count_cache.invalidate(cls.table_name())
         except Exception as e:
             logger.error(f'Unexpected error while executing query: {self.cursor._last_executed}\n%s', e)
             raise OtherException(cls())
@@ -1,3 +1,4 @@
+from app.Resource.DatabaseBase import unit_of_work
 from app.Resource.SimpleModelResource import SimpleModelResource as SR
 from app.Model.Customer import Customer
 from app.Model.Address import Address
@@ -51,20 +52,12 @@ def delete_customer(customer_id):
     SR().delete(Customer(pk=customer_id))
 
 
-# TODO elegant transaction
 def create_customer_with_address(customer, address):
-    sr = SR()
-    try:
+    with unit_of_work():
+        sr = SR()
         created_customer = sr.insert(customer, commit=False)
         address.customer_id = created_customer.id
         sr.insert(address, commit=False)
-    except Exception as e:
-        sr.connection.rollback()
-        sr.cursor.close()
-        raise e
-    else:
-        sr.connection.commit()
-        sr.cursor.close()
 
 
 def list_customer_addresses(customer_id):
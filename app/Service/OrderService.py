@@ -7,6 +7,7 @@ from app.Model.OrderDetail import OrderDetail
 from app.Model.Product import Product
 from app.Model.Session import Session
 from app.Util import AuthUtil as authUtil
+from app.Resource.DatabaseBase import unit_of_work
 from app.Resource.OrderResource import OrderResource as OR
 from app.Resource.SimpleModelResource import SimpleModelResource as SR
 from app.Resource.ProductResource import ProductResource as PR
@@ -27,27 +28,30 @@ def get_order_history(session_id) -> dict:
 
 
 def save_order(session_key, customer_id, delivery_addr_id, billing_addr_id, lines, instructions=""):
-    # Retrieve objs
-    sess = SR().find_one(Session({'sessionKey': session_key}))
-    org = SR().get_one_by_id(Organization(pk=sess.orgId))
-    cust = SR().get_one_by_id(Customer(pk=customer_id))
-    deli = SR().get_one_by_id(Address(pk=delivery_addr_id))
-    bill = SR().get_one_by_id(Address(pk=billing_addr_id))
-    # Lines Info
-    details_list = []
-    for line in lines:
-        product = SR().get_one_by_id(Product(pk=line['product_id']))
-        PR().assign_price_and_images_to_product([product])
-        details = OrderDetail({
-            'lineType': 'PRODUCT',
-            'keyProductID': product.keyProductID,
-            'productName': product.name,
-            'quantity': line['quantity'],
-            'unitPrice': product.price,
-            'productCode': product.productCode,
-            'productId': product.id
-        })
-        details_list.append(details)
+    # The SQUIZZ round trip runs outside of any unit of work, so no connection
+    # or transaction is held while waiting for it
+    with unit_of_work():
+        # Retrieve objs
+        sess = SR().find_one(Session({'sessionKey': session_key}))
+        org = SR().get_one_by_id(Organization(pk=sess.orgId))
+        cust = SR().get_one_by_id(Customer(pk=customer_id))
+        deli = SR().get_one_by_id(Address(pk=delivery_addr_id))
+        bill = SR().get_one_by_id(Address(pk=billing_addr_id))
+        # Lines Info
+        details_list = []
+        for line in lines:
+            product = SR().get_one_by_id(Product(pk=line['product_id']))
+            PR().assign_price_and_images_to_product([product])
+            details = OrderDetail({
+                'lineType': 'PRODUCT',
+                'keyProductID': product.keyProductID,
+                'productName': product.name,
+                'quantity': line['quantity'],
+                'unitPrice': product.price,
+                'productCode': product.productCode,
+                'productId': product.id
+            })
+            details_list.append(details)
 
     # Post Order to SQUIZZ to get tax info
     connection = authUtil.build_connection()
@@ -62,9 +66,11 @@ def save_order(session_key, customer_id, delivery_addr_id, billing_addr_id, line
         line.totalPrice = line.priceTotalIncTax
 
     # Save order and order lines
-    return OR().create_order(org, cust, deli, bill, details_list, result_code, instructions)
+    with unit_of_work():
+        return OR().create_order(org, cust, deli, bill, details_list, result_code, instructions)
 
 
+@unit_of_work()
 def get_order(order_id):
     order = SR().get_one_by_id(Order(pk=order_id))
     lines = SR().find_all(OrderDetail({'orderId': order_id}))
@@ -1,27 +1,133 @@
 from app.Model.CateProd import CateProd
 from app.Model.Category import Category
 from app.Model.Price import Price
+from app.Resource.DatabaseBase import unit_of_work, chunked
 from app.Resource.SimpleModelResource import SimpleModelResource as SR
 from app.Model.Product import Product
-from app.Resource.ProductResource import ProductResource
+from app.Resource.ProductResource import ProductResource, SEARCHABLE_IDENTIFIERS
 from app.Resource.UserResource import UserResource
 from app.Resource.ModelMetadataResource import ModelMetadataResource
 from app.Util import AuthUtil as authUtil
+from app.Util.Cache import count_cache, LRUCache, SingleFlight
+from app.Util.PrefixIndex import PrefixIndex
+from app.Util.CatalogVersion import catalog_version
+from app.Util.Compression import compressed_cache
+from app.Util.Serializer import dumps
+from app.Service.SquizzGatewayService import session_pool
+from app import config
 from app.Resource.ImageResource import ImageResource
+import hashlib
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+# Assembled responses of product lookups, keyed by (identifierType, identifier), and ('detail', identifierType, identifier)
+product_cache = LRUCache(config.PRODUCT_CACHE_SIZE, config.PRODUCT_CACHE_TTL)
+# "No data found" responses, with the same keys, kept for a shorter time
+not_found_cache = LRUCache(config.PRODUCT_CACHE_SIZE, config.PRODUCT_NOT_FOUND_TTL)
+# Concurrent lookups of the same key share one query
+product_lookups = SingleFlight()
+
+NOT_FOUND = "No data found"
+
+# The /api/categories response as (JSON bytes, ETag), None until build_category_tree() has run
+category_tree = None
+
+# identifierType -> PrefixIndex answering search_products, empty until build_search_index() has run
+search_indexes = {}
+
+
+def _invalidate_catalog_caches(rebuild_search_index=False):
+    """
+    Called by every entry point that writes products, prices, images or metadata.
+    The version is bumped last: a response built from the old search index in the
+    meantime still carries the old ETag, so it is not served once the index is new.
+
+    Args:
+        rebuild_search_index: rebuild the search index, after a write of products
+    """
+    product_cache.invalidate()
+    not_found_cache.invalidate()
+    if rebuild_search_index:
+        try:
+            build_search_index()
+        except Exception as e:
+            # Searches fall back to the SQL query rather than use the stale index
+            logger.error("Could not rebuild the product search index: %s", str(e))
+            search_indexes.clear()
+    catalog_version.bump()
+
+
+def _cached_product(key, load) -> dict:
+    """
+    Return the cached lookup result for key. Otherwise call load(), or wait
+    for the call already running for key, and cache its result if a product
+    was found or if there is none.
+    """
+    result = product_cache.get(key) or not_found_cache.get(key)
+    if result is not None:
+        return result
+    return product_lookups.do(key, lambda: _load_product(key, load))
+
+
+def _load_product(key, load) -> dict:
+    generation = product_cache.generation(), not_found_cache.generation()
+    result = load()
+    if result['status'] == 'success':
+        product_cache.set(key, result, generation[0])
+    elif result['Message'] == NOT_FOUND:
+        not_found_cache.set(key, result, generation[1])
+    return result
+
+
+def build_search_index():
+    """
+    Build the prefix indexes of search_products from the products table.
+    Runs at start up and after every product sync, searches use the SQL
+    query until the first build completes.
+    """
+    identifiers = {identifier_type: [] for identifier_type in SEARCHABLE_IDENTIFIERS}
+    for rows in ProductResource().iter_identifiers():
+        for row in rows:
+            for identifier_type, values in identifiers.items():
+                values.append(row[identifier_type])
+    # Swap the new indexes in at once, searches running meanwhile keep the old ones
+    search_indexes.update({identifier_type: PrefixIndex(values) for identifier_type, values in identifiers.items()})
+    logger.info("Built the product search index, %d barcodes and %d product codes",
+                len(search_indexes['barcode']), len(search_indexes['productCode']))
+
+
+def warm_up():
+    """Build the in-memory catalog structures at start up, a failure leaves the SQL fallbacks in use"""
+    try:
+        build_search_index()
+    except Exception as e:
+        logger.error("Could not build the product search index: %s", str(e))
+    _refresh_category_tree()
+
+
+def cache_stats() -> dict:
+    """Counters of the in-process caches and pools, see LRUCache.stats(), SingleFlight.stats() and SquizzSessionPool.stats()"""
+    return {
+        'product': product_cache.stats(),
+        'not_found': not_found_cache.stats(),
+        'lookups': product_lookups.stats(),
+        'compressed': compressed_cache.stats(),
+        'squizz_sessions': session_pool.stats(),
+    }
+
 
 def retrieve_products(customer_code="TESTDEBTOR") -> dict:
     connection = authUtil.build_connection()
     data_type = 3
-    success, product_list = connection.retrieve_organisation_data(data_type, customer_code=customer_code)
+    success, product_list = connection.stream_organisation_data(data_type, customer_code=customer_code)
     product_resource = ProductResource()
     if success:
-        return product_resource.store_products(product_list)
+        result = product_resource.store_products(product_list)
+        _invalidate_catalog_caches(rebuild_search_index=True)
+        return result
 
     return {
         'status': "error",
@@ -33,10 +139,12 @@ def retrieve_products(customer_code="TESTDEBTOR") -> dict:
 def retrieve_prices() -> dict:
     connection = authUtil.build_connection()
     data_type = 37
-    success, price_list = connection.retrieve_organisation_data(data_type)
+    success, price_list = connection.stream_organisation_data(data_type)
     product_resource = ProductResource()
     if success:
-        return product_resource.store_prices(price_list)
+        result = product_resource.store_prices(price_list)
+        _invalidate_catalog_caches()
+        return result
 
     return {
         'status': 'error',
@@ -46,6 +154,10 @@ def retrieve_prices() -> dict:
 
 
 def get_product_by_barcode(barcode) -> dict:
+    return _cached_product(('barcode', barcode), lambda: _load_product_by_barcode(barcode))
+
+
+def _load_product_by_barcode(barcode) -> dict:
     # Get Product Details
     product_resource = ProductResource()
     product_record = product_resource.get_product_by_barcode(barcode)
@@ -73,7 +185,7 @@ def get_product_by_barcode(barcode) -> dict:
             result = {
                 'status': "error",
                 'data': None,
-                'Message': "No data found"
+                'Message': NOT_FOUND
             }
     except Exception as e:
         result = {
@@ -85,7 +197,82 @@ def get_product_by_barcode(barcode) -> dict:
     return result
 
 
+def get_product_detail(identifier, identifierType) -> dict:
+    """
+    Everything about one product in a single call: its fields, effective
+    price, images, 3D model location and parsed metadata
+
+    Args:
+        identifier: a barcode or product code
+        identifierType: 'barcode' or 'productCode'
+    """
+    return _cached_product(('detail', identifierType, identifier),
+                           lambda: _load_product_detail(identifier, identifierType))
+
+
+def _load_product_detail(identifier, identifierType) -> dict:
+    detail = ProductResource().get_product_detail(identifier, identifierType)
+    if detail is None:
+        return {
+            'status': "error",
+            'data': None,
+            'Message': NOT_FOUND
+        }
+
+    product, meta_json_string = detail
+    metadata = None
+    if meta_json_string:
+        try:
+            metadata = json.loads(meta_json_string)
+        except ValueError as e:
+            logger.error("Invalid metadata of product %s: %s", product.productCode, str(e))
+
+    product_dict = dict(product.__dict__, imageList=[image.__dict__ for image in product.imageList])
+    product_dict['threeDModelLocation'] = next(
+        (image.threeDModelLocation for image in product.imageList if image.is3DModelType == 'Y'), None)
+    product_dict['metadata'] = metadata
+    return {
+        'status': "success",
+        'Message': "successfully retrieved product",
+        'data': product_dict
+    }
+
+
+def get_products_by_barcodes(barcodes: list) -> dict:
+    """
+    Look up many barcodes at once, e.g. every item of a scanned pallet
+
+    Args:
+        barcodes: list of barcode strings
+
+    Returns:
+        one result per barcode, in the order given, shaped like the result of
+        get_product_by_barcode with the barcode added
+    """
+    products = ProductResource().get_products_by_barcodes(barcodes)
+
+    results = []
+    for barcode in barcodes:
+        product = products.get(barcode)
+        if product is None:
+            results.append({'barcode': barcode, 'status': "error", 'data': None, 'Message': NOT_FOUND})
+            continue
+        product_dict = dict(product.__dict__, imageList=[image.__dict__ for image in product.imageList])
+        results.append({'barcode': barcode, 'status': "success", 'data': product_dict})
+
+    found = sum(1 for result in results if result['status'] == "success")
+    return {
+        'status': "success",
+        'Message': f"successfully retrieved {found} of {len(barcodes)} products",
+        'data': results
+    }
+
+
 def get_product_by_product_code(productCode) -> dict:
+    return _cached_product(('productCode', productCode), lambda: _load_product_by_product_code(productCode))
+
+
+def _load_product_by_product_code(productCode) -> dict:
     # Get Product Details
     pr = ProductResource()
     product_record = pr.get_product_by_product_code(productCode)
@@ -113,7 +300,7 @@ def get_product_by_product_code(productCode) -> dict:
             result = {
                 'status': "error",
                 'data': None,
-                'Message': "No data found"
+                'Message': NOT_FOUND
             }
     except Exception as e:
         result = {
@@ -138,9 +325,15 @@ def search_products(identifier, identifierType):
         JSON object including a list of similar identifiers, or no identifiers, if none were found
     """
 
-    product_resource = ProductResource()
-    product_identifiers = product_resource.search_products(identifier, identifierType)
-    
+    identifier = identifier or ''
+    index = search_indexes.get(identifierType)
+    if index is not None:
+        product_identifiers = [{identifierType: value}
+                               for value in index.search(identifier, config.SEARCH_RESULT_LIMIT)]
+    else:
+        product_resource = ProductResource()
+        product_identifiers = product_resource.search_products(identifier, identifierType, config.SEARCH_RESULT_LIMIT)
+
     if not product_identifiers:
         result = {
             'status': 'error',
@@ -163,14 +356,23 @@ def get_product_images(id) -> dict:
     return image_records
 
 
+def _changed(result) -> bool:
+    """Whether a sync wrote anything, an unchanged catalog keeps its caches and ETags"""
+    data = result['data']
+    return bool(data['inserted'] or data['updated'] or data.get('deleted'))
+
+
 def update_products() -> dict:
     product_resource = ProductResource()
     connection = authUtil.build_connection()
     data_type = 3
-    success, product_list = connection.retrieve_organisation_data(data_type)
+    success, product_list = connection.stream_organisation_data(data_type)
 
     if success:
-        return product_resource.update_products(product_list)
+        result = product_resource.update_products(product_list)
+        if _changed(result):
+            _invalidate_catalog_caches(rebuild_search_index=True)
+        return result
 
     return {
         'status': 'error',
@@ -182,11 +384,14 @@ def update_products() -> dict:
 def update_prices(customer_code='TESTDEBTOR') -> dict:
     connection = authUtil.build_connection()
     data_type = 37
-    success, price_list = connection.retrieve_organisation_data(data_type, customer_code)
+    success, price_list = connection.stream_organisation_data(data_type, customer_code)
     product_resource = ProductResource()
 
     if success:
-        return product_resource.update_prices(price_list)
+        result = product_resource.update_prices(price_list)
+        if _changed(result):
+            _invalidate_catalog_caches()
+        return result
 
     return {
         'status': 'error',
@@ -233,6 +438,7 @@ def import_metadata(data) -> dict:
         if status_code == 0:
             errormessage += '\"' + code + '\" '
             continue
+    _invalidate_catalog_caches()
     if errormessage == "":
         return {"status": "success", "message": "metadata was imported successfully"}
     else:
@@ -280,6 +486,7 @@ def import_threedmodel(data) -> dict:
             link = record['threeDModelLocation']
             if link is None or link != url:
                 image_resource.update_threed_link(url, id_list)
+    _invalidate_catalog_caches()
     if errormessage == "":
         return {'status': "success", "message": "3d model have been imported successfully"}
     else:
@@ -299,6 +506,7 @@ def get_metadata_by_product_code(productCode) -> dict:
 
 def restore_category():
     connection = authUtil.build_connection()
+    # Categories are few and read twice below, they are retrieved as a list
     status, categories = connection.retrieve_organisation_data(8)
 
     if not status:
@@ -307,17 +515,15 @@ def restore_category():
             'message': 'Retrieve data from squizz failed.'
         }
 
-    sr = SR()
-    try:
+    with unit_of_work():
+        sr = SR()
         # Rewrite categories
         sr.truncate(CateProd, False)
         sr.truncate(Category, False)
         sr.batch_insert(categories, commit=False)
 
-        # Traverse products and convert to key, id pairs
-        prod_key_id = {}
-        for product in sr.list_all(Product):
-            prod_key_id[product.keyProductID] = product.id
+        # Stream products and convert to key, id pairs
+        prod_key_id = ProductResource().product_key_map()
 
         # Rewrite category product relationships
         for category in categories:
@@ -332,13 +538,10 @@ def restore_category():
                 cate_prod_rel = CateProd({'categoryId': category.id, 'productId': prod_key_id[productKey]})
                 sr.insert(cate_prod_rel, commit=False)
 
-    except Exception as e:
-        sr.connection.rollback()
-        sr.cursor.close()
-        raise e
-    else:
-        sr.connection.commit()
-        sr.cursor.close()
+    # Drop counts cached by readers while the transaction was still open
+    count_cache.invalidate(Category.table_name(), CateProd.table_name())
+    _refresh_category_tree()
+    catalog_version.bump()
 
     return {
         'status': 'Success',
@@ -348,38 +551,25 @@ def restore_category():
 
 def restore_prices(customer_code="TESTDEBTOR"):
     connection = authUtil.build_connection()
-    status, prices = connection.retrieve_organisation_data(37, customer_code)
+    status, prices = connection.stream_organisation_data(37, customer_code)
     if not status:
         return {
             'status': 'Failed',
             'message': 'Retrieve data from squizz failed.'
         }
 
-    sr = SR()
-    try:
-        # Truncate prices
-        sr.truncate(Price, False)
-
-        # Traverse products and convert to key, id pairs
-        prod_key_id = {}
-        for product in sr.list_all(Product, ['keyProductId', 'id']):
-            prod_key_id[product.keyProductID] = product.id
+    # Read the whole price list before truncating: a SQUIZZ stream failing half-way
+    # must not happen while the deleted prices are locked in the open transaction
+    prices = list(prices)
 
-        # Rewrite prices
-        for price in prices:
-            if price.keyProductID not in prod_key_id:
-                continue
-            price.productId = prod_key_id[price.keyProductID]
-            sr.insert(price, False)
+    with unit_of_work():
+        # Truncate prices
+        SR().truncate(Price, False)
 
-    except Exception as e:
-        sr.connection.rollback()
-        sr.cursor.close()
-        raise e
-    else:
-        sr.connection.commit()
-        sr.cursor.close()
+        # Rewrite prices, the prices of unknown products are skipped
+        ProductResource().store_prices(prices)
 
+    _invalidate_catalog_caches()
     return {
         'status': 'Success',
         'message': 'Price data Updated.'
@@ -405,9 +595,87 @@ def list_all_categories():
     return p_cate_list, c_cate_dict
 
 
-def list_all_products(category_id=None, page=1, page_size=20):
-    # List products
-    result = ProductResource().list_products_by_category(category_id, page, page_size)
+def build_category_tree():
+    """
+    Build and serialize the /api/categories response: the top level
+    categories, each with its sub categories nested under 'Children' at
+    any depth. Every category has a 'productCount', the number of distinct
+    products in it and its sub categories.
+    """
+    global category_tree
+    parents, children = list_all_categories()
+    product_ids = ProductResource().category_product_ids()
+
+    def node(category, ancestors):
+        category_dict = dict(category.__dict__)
+        category_products = set(product_ids.get(category.id, ()))
+        category_dict['Children'] = []
+        # A category listed as its own ancestor would recurse forever
+        if category.keyCategoryID not in ancestors:
+            for child in children.get(category.keyCategoryID, []):
+                child_dict, child_products = node(child, ancestors | {category.keyCategoryID})
+                category_dict['Children'].append(child_dict)
+                category_products |= child_products
+        category_dict['productCount'] = len(category_products)
+        return category_dict, category_products
+
+    tree = [node(category, frozenset())[0] for category in parents]
+    body = json.dumps(tree, sort_keys=True, separators=(',', ':')).encode()
+    category_tree = (body, hashlib.sha1(body).hexdigest())
+    return category_tree
+
+
+def get_category_tree():
+    """Returns the /api/categories response as (JSON bytes, ETag), see build_category_tree()"""
+    return category_tree or build_category_tree()
+
+
+def _refresh_category_tree():
+    """Rebuild the category tree, if that fails the next request builds it"""
+    global category_tree
+    category_tree = None
+    try:
+        build_category_tree()
+    except Exception as e:
+        logger.error("Could not build the category tree: %s", str(e))
+
+
+def list_all_products(category_id=None, page=1, page_size=20, after=None, with_total=True):
+    # List products, by page number or after a keyset cursor
+    result = ProductResource().list_products_by_category(category_id, page, page_size, after, with_total)
     # set product price
     ProductResource().assign_price_and_images_to_product(result['items'])
     return result
+
+
+def export_catalog(batch_size=None):
+    """
+    Every product with its effective price, images and categories, as
+    NDJSON: one JSON document per product and line.
+
+    Products are streamed from a server-side cursor on one connection,
+    batch_size at a time, while their prices, images and categories are
+    queried once per batch on a second connection. Memory use does not
+    depend on the size of the catalog.
+
+    Returns:
+        a generator of bytes, each holding the lines of one batch
+    """
+    batch_size = batch_size or config.EXPORT_BATCH_SIZE
+    # Borrowed now, so that an exhausted pool fails the request before streaming starts
+    reader, details = ProductResource(), ProductResource()
+    return _export_lines(reader, details, batch_size)
+
+
+def _export_lines(reader, details, batch_size):
+    products = reader.iter_products_by_category(None, batch_size)
+    try:
+        for batch in chunked(products, batch_size):
+            details.assign_price_and_images_to_product(batch)
+            details.assign_categories_to_product(batch)
+            yield b''.join(dumps(product) + b'\n' for product in batch)
+    finally:
+        # Closing the generator closes the server-side cursor before the connection goes back to the pool
+        products.close()
+        reader.connection.close()
+        details.connection.close()
@@ -1,7 +1,11 @@
+import atexit
 import logging
+import threading
 import requests
 import time
-from typing import Tuple, Optional
+from typing import Iterator, Tuple, Optional
+
+from app import config
 
 from app.Model.Customer import Customer
 from app.Model.OrderDetail import OrderDetail
@@ -9,12 +13,157 @@ from app.Model.Organization import Organization
 from app.Model.Product import Product
 from app.Model.Category import Category
 from app.Model.Price import Price
+from app.Util.EsdStream import EsdStream
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 
+# Model built from the records of each retrieve_esd data type
+ESD_MODELS = {3: Product, 8: Category, 37: Price}
+
+# Bytes read from the retrieve_esd response at a time
+ESD_CHUNK_SIZE = 64 * 1024
+
+# result_code of SQUIZZ responses when the session has expired or was destroyed
+SESSION_INVALID = "SESSION_INVALID"
+
+
+class PooledSession:
+    """A SQUIZZ API session id, with the gateway that created it"""
+
+    def __init__(self, session_id: str, gateway):
+        self.session_id = session_id
+        self.gateway = gateway
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class SquizzSessionPool:
+    """
+    Process-wide pool of SQUIZZ API sessions, so that syncs and order
+    submissions do not create a session each.
+
+    Sessions are kept per organisation and checked out by one call at a
+    time. A session older than SQUIZZ_SESSION_TTL is destroyed instead of
+    reused, one idle for longer than SQUIZZ_SESSION_VALIDATE_AFTER is
+    validated with SQUIZZ first. Calls that get SESSION_INVALID anyway
+    discard the session and retry once with a new one, see
+    SquizzGatewayService.with_session(). Idle sessions are destroyed when
+    the process exits.
+    """
+
+    def __init__(self, max_idle=None, ttl=None, validate_after=None):
+        self.max_idle = max_idle or config.SQUIZZ_SESSION_POOL_SIZE
+        self.ttl = ttl or config.SQUIZZ_SESSION_TTL
+        self.validate_after = validate_after or config.SQUIZZ_SESSION_VALIDATE_AFTER
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {'acquires': 0, 'reused': 0, 'created': 0, 'validated': 0,
+                       'expired': 0, 'invalidated': 0, 'destroyed': 0, 'acquire_seconds': 0.0}
+
+    @staticmethod
+    def _key(gateway):
+        return gateway.base_url, gateway.org_id, gateway.api_org_key
+
+    def acquire(self, gateway) -> Tuple[Optional[PooledSession], str]:
+        """
+        Check out a session of the gateway's organisation, creating one if
+        none of the idle ones can be reused
+
+        :return: (session, "LOGIN_SUCCESS"), or (None, result code) if SQUIZZ refused to create one
+        """
+        start = time.monotonic()
+        key = self._key(gateway)
+        try:
+            while True:
+                with self._lock:
+                    idle = self._idle.get(key)
+                    pooled = idle.pop() if idle else None
+                if pooled is None:
+                    break
+
+                now = time.monotonic()
+                if now - pooled.created > self.ttl:
+                    self._count('expired')
+                    self._destroy(pooled)
+                    continue
+                if now - pooled.last_used > self.validate_after:
+                    self._count('validated')
+                    try:
+                        valid = gateway.validate_session(pooled.session_id)
+                    except Exception as e:
+                        logger.debug("Could not validate organisation API session. %s", e)
+                        valid = False
+                    if not valid:
+                        self._count('invalidated')
+                        continue
+                self._count('reused')
+                return pooled, "LOGIN_SUCCESS"
+
+            session_id, result_code = gateway.create_session()
+            if session_id is None:
+                return None, result_code
+            self._count('created')
+            return PooledSession(session_id, gateway), result_code
+        finally:
+            with self._lock:
+                self._stats['acquires'] += 1
+                self._stats['acquire_seconds'] += time.monotonic() - start
+
+    def release(self, pooled: PooledSession):
+        """Return a session that is still valid, the oldest sessions beyond max_idle are destroyed"""
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault(self._key(pooled.gateway), [])
+            idle.append(pooled)
+            surplus = idle[:-self.max_idle] if len(idle) > self.max_idle else []
+            del idle[:len(surplus)]
+        for extra in surplus:
+            self._destroy(extra)
+
+    def discard(self, pooled: PooledSession):
+        """Forget a session SQUIZZ reported as invalid"""
+        self._count('invalidated')
+
+    def abandon(self, pooled: PooledSession):
+        """Destroy a session whose state is unknown after a failed call, best effort"""
+        self._destroy(pooled)
+
+    def close_all(self):
+        """Destroy every idle session"""
+        with self._lock:
+            sessions = [pooled for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+        for pooled in sessions:
+            self._destroy(pooled)
+
+    def stats(self):
+        """Counters since start up, with the mean acquire latency and the share of acquires served by reuse"""
+        with self._lock:
+            stats = dict(self._stats, idle=sum(len(idle) for idle in self._idle.values()))
+        acquires = stats['acquires']
+        stats['acquire_ms_avg'] = round(stats.pop('acquire_seconds') * 1000 / acquires, 3) if acquires else 0.0
+        stats['reuse_rate'] = round(stats['reused'] / acquires, 3) if acquires else 0.0
+        return stats
+
+    def _destroy(self, pooled):
+        self._count('destroyed')
+        try:
+            pooled.gateway.destroy_session(pooled.session_id)
+        except Exception as e:
+            logger.debug("Could not destroy organisation API session. %s", e)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+session_pool = SquizzSessionPool()
+atexit.register(session_pool.close_all)
+
+
 class SquizzGatewayService:
     """
     This class represents a connection, or session, to the SQUIZZ Platform API
@@ -71,38 +220,91 @@ class SquizzGatewayService:
             logger.debug("Could not validate organisation API session")
             return False
 
+    def with_session(self, call):
+        """
+        Run call(session_id) with a session from the pool. call returns the
+        decoded SQUIZZ response, if its result_code is SESSION_INVALID the
+        session is dropped and the call is retried once with a new session.
+
+        :return: (response of call, or None if no session could be created, result code of the session creation)
+        """
+        for attempt in range(2):
+            pooled, result_code = session_pool.acquire(self)
+            if pooled is None:
+                return None, result_code
+            try:
+                response = call(pooled.session_id)
+            except Exception:
+                # The state of the session is unknown, do not reuse it
+                session_pool.abandon(pooled)
+                raise
+            if response.get("result_code") == SESSION_INVALID:
+                logger.info("SQUIZZ session expired, retrying with a new session")
+                session_pool.discard(pooled)
+                continue
+            session_pool.release(pooled)
+            return response, result_code
+        return response, result_code
+
     # Web Service Endpoint: Retrieve Organisation Data
     def retrieve_organisation_data(self, data_type: int, customer_code='TESTDEBTOR') -> Tuple[bool, Optional[list]]:
-        assert(data_type == 3 or data_type == 8 or data_type == 37)
-
-        session_id, _ = self.create_session()
-        params = {
-            "session_id": session_id,
-            "supplier_org_id": self.supplier_org_id,
-            "data_type_id": data_type,
-            "customer_account_code": customer_code  # Default customer account code is TESTDEBTOR
-        }
-        
-        response = self.requests.get("https://api.squizz.com/rest/1/org/retrieve_esd/" + session_id, params=params).json()
-        if response["resultStatus"] == 1:
-            if data_type == 3:
-                data = [Product(entry) for entry in response['dataRecords']]
-            elif data_type == 8:
-                data = [Category(entry) for entry in response['dataRecords']]
-            else:
-                data = [Price(entry) for entry in response['dataRecords']]
-            return True, data
-
+        success, records = self.stream_organisation_data(data_type, customer_code)
+        if success:
+            return True, list(records)
         return False, None
 
+    def stream_organisation_data(self, data_type: int, customer_code='TESTDEBTOR') -> Tuple[bool, Optional[Iterator]]:
+        """
+        Streaming variant of retrieve_organisation_data: the response body is
+        parsed as it is read, and the models are yielded one record at a time,
+        so the whole data set is never held in memory. The generator must be
+        consumed (or closed) to release the HTTP connection.
+
+        Args:
+            data_type: 3 for products, 8 for categories, 37 for prices
+            customer_code: customer account the prices are retrieved for
+        Returns:
+            (True, generator of Product, Category or Price), or (False, None)
+        """
+        assert(data_type in ESD_MODELS)
+        streams = []
+
+        def retrieve(session_id):
+            params = {
+                "session_id": session_id,
+                "supplier_org_id": self.supplier_org_id,
+                "data_type_id": data_type,
+                "customer_account_code": customer_code  # Default customer account code is TESTDEBTOR
+            }
+            response = self.requests.get("https://api.squizz.com/rest/1/org/retrieve_esd/" + session_id,
+                                         params=params, stream=True)
+            response.encoding = response.encoding or 'utf-8'
+            stream = EsdStream(response.iter_content(ESD_CHUNK_SIZE, decode_unicode=True), close=response.close)
+            streams.append(stream)
+            return stream.read_header()
+
+        try:
+            header, _ = self.with_session(retrieve)
+        except Exception:
+            for stream in streams:
+                stream.close()
+            raise
+        # Only the last stream can still be open, the others were answered with SESSION_INVALID
+        for stream in streams[:-1]:
+            stream.close()
+        if header is None or header.get("resultStatus") != 1:
+            if streams:
+                streams[-1].close()
+            return False, None
+
+        model = ESD_MODELS[data_type]
+        return True, (model(record) for record in streams[-1].records())
+
     """
     Post order to SQUIZZ
     """
     def submit_order(self, org: Organization, customer: Customer, order_details_list: [OrderDetail]):
-        session_id, _ = self.create_session()
         header = {"Content-Type": "application/json"}
-        purchase_url = (f"https://api.squizz.com/rest/1/org/procure_purchase_order_from_supplier/{session_id}\
-        ?supplier_org_id={org.supplierOrgId}&customer_account_code={customer.customer_code}")
 
         uuid = int(time.time() * 1000000)
         data_record = {
@@ -125,7 +327,14 @@ class SquizzGatewayService:
         }
         # print(post_body)
 
-        data = self.requests.post(purchase_url, json=post_body, headers=header).json()
+        def post_order(session_id):
+            purchase_url = (f"https://api.squizz.com/rest/1/org/procure_purchase_order_from_supplier/{session_id}\
+        ?supplier_org_id={org.supplierOrgId}&customer_account_code={customer.customer_code}")
+            return self.requests.post(purchase_url, json=post_body, headers=header).json()
+
+        data, result_code = self.with_session(post_order)
+        if data is None:
+            return result_code, []
         # print(data)
         lines_data = data['dataRecords'][0]['lines'].copy()
 
@@ -0,0 +1,169 @@
+"""
+In-process caches for catalog data that only changes when it is synced
+"""
+import threading
+import time
+from collections import OrderedDict
+from app import config
+
+
+class CountCache:
+    """
+    Row counts keyed by table and filter, e.g. ('categoryproducts', 2079).
+
+    Every write path invalidates the tables it touches. Entries also expire
+    after ttl seconds, as other processes may write to the same tables.
+    A count read while the table was being invalidated is not stored, see
+    generation().
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._counts = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, table, key=None):
+        """Return the cached count, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._counts.get((table, key))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def generation(self, table):
+        """Snapshot to take before counting, and to pass to set()"""
+        with self._lock:
+            return self._generations.get(table, 0)
+
+    def set(self, table, key, count, generation):
+        """Store a count, unless the table was invalidated since generation was taken"""
+        with self._lock:
+            if self._generations.get(table, 0) == generation:
+                self._counts[(table, key)] = (count, time.monotonic() + self.ttl)
+
+    def invalidate(self, *tables):
+        """Drop every count of the given tables"""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            for table, key in list(self._counts):
+                if table in tables:
+                    del self._counts[(table, key)]
+
+
+class LRUCache:
+    """
+    Bounded mapping whose entries expire after ttl seconds. When full, the
+    least recently used entry is evicted to make room.
+
+    Like CountCache, a value loaded while the cache was being invalidated
+    is not stored, see generation(). Cached values are shared between
+    callers and must not be modified.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key, default=None):
+        """Return the cached value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def generation(self):
+        """Snapshot to take before loading a value, and to pass to set()"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None):
+        """Store a value, unless the cache was invalidated since generation was taken"""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self):
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        """Counters since start up, and the current number of entries"""
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_size=self.max_size)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: while a load for a key is
+    running, other threads asking for that key wait for it and share its
+    result (or its exception) instead of running their own.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, load):
+        """Return load(), or the result of the load already running for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self._stats['calls'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = load()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise e
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Loads run, and calls that waited for a running load instead"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+count_cache = CountCache(config.COUNT_CACHE_TTL)
@@ -0,0 +1,68 @@
+"""
+Version of the catalog data, for conditional GETs of the read endpoints
+"""
+import datetime
+import functools
+import threading
+import time
+from flask import Response, make_response, request
+from werkzeug.http import is_resource_modified
+
+
+class CatalogVersion:
+    """
+    Counter bumped by every path that writes catalog data (products,
+    prices, images, categories, metadata). Responses built from the catalog
+    are tagged with it, and a client holding the current tag is answered
+    with 304 without running the view.
+
+    The counter lives in the process, so it only sees the writes made by
+    this process. The tag includes the start time of the process, so a
+    restarted server never matches tags issued before the restart.
+    """
+
+    def __init__(self):
+        self._boot = '%x' % int(time.time() * 1000)
+        self._version = 1
+        self._modified = datetime.datetime.utcnow().replace(microsecond=0)
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Record a change of the catalog"""
+        with self._lock:
+            self._version += 1
+            self._modified = datetime.datetime.utcnow().replace(microsecond=0)
+
+    def current(self):
+        """Returns (ETag, Last-Modified as naive UTC datetime) of the current version"""
+        with self._lock:
+            return f'{self._boot}-{self._version}', self._modified
+
+
+catalog_version = CatalogVersion()
+
+
+def conditional(view):
+    """
+    Decorator for the views returning catalog data. Answers 304 when the
+    request's If-None-Match (or If-Modified-Since) matches the current
+    catalog version, otherwise runs the view and tags its 200 response
+    with ETag and Last-Modified. An ETag set by the view is kept.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Taken before the view runs, a write meanwhile makes the next request miss
+        etag, modified = catalog_version.current()
+        if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        if response.get_etag()[0] is None:
+            response.set_etag(etag)
+        response.last_modified = modified
+        return response
+
+    return wrapper
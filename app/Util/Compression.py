@@ -0,0 +1,63 @@
+"""
+gzip compression of responses, negotiated with Accept-Encoding
+"""
+import gzip
+from flask import request
+from app import config
+from app.Util.Cache import LRUCache
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+# Compressed bodies of responses tagged with an ETag, keyed by (full path, ETag). A
+# new catalog version changes the ETag, so entries of older versions are never hit
+compressed_cache = LRUCache(config.COMPRESS_CACHE_SIZE, config.COMPRESS_CACHE_TTL)
+
+
+def init_compression(app):
+    """Compress the responses of app, see compress()"""
+    app.after_request(compress)
+
+
+def compress(response):
+    """
+    gzip the body of a complete 200 response when the client accepts it and
+    the body is at least COMPRESS_MIN_SIZE bytes. Streamed responses are
+    left alone, so is anything already encoded.
+
+    The gzip body is a different representation than the plain one, so its
+    ETag is made weak. Conditional requests compare ETags weakly, a client
+    holding either body is still answered with 304, tagged like its copy.
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    if response.status_code == 304:
+        # Tag the 304 like the body the client holds
+        etag, weak = response.get_etag()
+        if etag is not None and not weak and request.if_none_match.is_weak(etag):
+            response.set_etag(etag, weak=True)
+        return response
+
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+
+    data = response.get_data()
+    if len(data) < config.COMPRESS_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    key = (request.full_path, etag) if etag is not None and not weak else None
+    compressed = compressed_cache.get(key) if key is not None else None
+    if compressed is None:
+        compressed = gzip.compress(data, compresslevel=config.COMPRESS_LEVEL)
+        if key is not None:
+            compressed_cache.set(key, compressed)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    if key is not None:
+        response.set_etag(etag, weak=True)
+    return response
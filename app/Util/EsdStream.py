@@ -0,0 +1,124 @@
+"""
+Incremental parser for the ESD documents returned by SQUIZZ retrieve_esd
+"""
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class EsdStream:
+    """
+    Reads an ESD document such as
+
+        {"resultStatus": 1, "totalDataRecords": 2, ..., "dataRecords": [{...}, {...}]}
+
+    from an iterable of text chunks (e.g. Response.iter_content), without
+    holding the whole body. read_header() parses the fields before
+    dataRecords, records() then yields the records one at a time, and the
+    fields after dataRecords are added to header once it is exhausted.
+    Only the record being parsed and the unread part of the current chunk
+    are held in memory.
+    """
+
+    def __init__(self, chunks, records_key='dataRecords', close=None):
+        self.header = {}
+        self._chunks = iter(chunks)
+        self._records_key = records_key
+        self._close = close
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._started = False
+        self._in_records = False
+        self._done = False
+
+    def read_header(self) -> dict:
+        """Parse up to the start of the records, or the whole document if it has none"""
+        if not self._started:
+            self._expect('{')
+            self._started = True
+            self._read_fields()
+        return self.header
+
+    def records(self):
+        """Yield the decoded records, in order"""
+        self.read_header()
+        try:
+            while self._in_records:
+                if self._peek() == ']':
+                    self._pos += 1
+                    self._in_records = False
+                    break
+                yield self._value()
+                if self._peek() == ',':
+                    self._pos += 1
+            self._read_fields()
+        finally:
+            self.close()
+
+    def close(self):
+        """Release the underlying stream"""
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def _read_fields(self):
+        """Read "key": value pairs until the records start or the document ends"""
+        while not self._done:
+            char = self._peek()
+            if char == '}':
+                self._pos += 1
+                self._done = True
+                break
+            if char == ',':
+                self._pos += 1
+                continue
+            key = self._value()
+            self._expect(':')
+            if key == self._records_key:
+                self._expect('[')
+                self._in_records = True
+                break
+            self.header[key] = self._value()
+
+    def _value(self):
+        """Decode the next JSON value, reading more chunks until it is complete"""
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read_chunk()
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError('Unexpected end of the ESD document')
+            self._read_chunk()
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self._pos} of the ESD document")
+        self._pos += 1
+
+    def _read_chunk(self):
+        # Drop what was consumed, so the buffer holds at most a record and a chunk
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer += chunk
+                return
+        self._eof = True
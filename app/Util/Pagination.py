@@ -0,0 +1,32 @@
+"""
+Opaque cursors for keyset (seek) pagination
+"""
+import base64
+import json
+from app.Exception.exceptions import IncorrectDataType
+
+
+def encode_cursor(last_id, category_id=None) -> str:
+    """Encode the id of the last item of a page, and its category filter, as an 'after' token"""
+    raw = json.dumps({'id': last_id, 'cate': category_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, category_id=None) -> int:
+    """
+    Decode an 'after' token into the id to continue from. An empty token
+    starts from the beginning.
+
+    :raise IncorrectDataType if the token is malformed or was issued for another category
+    """
+    if not token:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        cursor = json.loads(raw)
+        last_id = int(cursor['id'])
+    except (ValueError, TypeError, KeyError):
+        raise IncorrectDataType('after')
+    if cursor.get('cate') != category_id:
+        raise IncorrectDataType('after')
+    return last_id
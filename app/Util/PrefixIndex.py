@@ -0,0 +1,39 @@
+"""
+Sorted in-memory index answering prefix searches without the database
+"""
+from bisect import bisect_left
+
+
+class PrefixIndex:
+    """
+    Distinct values kept sorted by their case folded form, so the matches
+    of a prefix are a contiguous run found with a binary search. Matching
+    ignores case, like LIKE 'prefix%' under the catalog's collation.
+
+    An index is never modified once built, rebuild it to pick up changes.
+    """
+
+    def __init__(self, values=()):
+        entries = sorted({(value.casefold(), value) for value in values if value})
+        self._keys = [key for key, _ in entries]
+        self._values = [value for _, value in entries]
+
+    def __len__(self):
+        return len(self._values)
+
+    def search(self, prefix: str, limit: int) -> list:
+        """
+        Values starting with prefix, in sorted order
+
+        :param prefix: the typed start of a value, empty matches every value
+        :param limit: maximum number of values returned
+        """
+        prefix = prefix.casefold()
+        start = bisect_left(self._keys, prefix)
+        end = min(start + limit, len(self._keys))
+        matches = []
+        for i in range(start, end):
+            if not self._keys[i].startswith(prefix):
+                break
+            matches.append(self._values[i])
+        return matches
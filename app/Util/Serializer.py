@@ -0,0 +1,78 @@
+"""
+JSON serialization of responses and models.
+
+Uses orjson when it is installed, the standard json module otherwise.
+Both produce the same documents: keys sorted like jsonify, Decimal as a
+number, datetime and date as HTTP dates like Flask, and model objects as
+their attribute dicts, at any depth. Nothing is modified while serializing.
+"""
+import datetime
+import json
+from decimal import Decimal
+from werkzeug.http import http_date
+from app.Model.Model import Model
+from app.Model.CompactModel import CompactModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj):
+    """Convert the values json can not encode natively"""
+    if isinstance(obj, (Model, CompactModel)):
+        return obj.__dict__
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return http_date(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, sort_keys=True) -> bytes:
+        """Serialize obj into compact JSON bytes"""
+        return orjson.dumps(obj, default=default,
+                            option=_ORJSON_OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj, sort_keys=True) -> bytes:
+        """Serialize obj into compact JSON bytes"""
+        return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(',', ':')).encode()
+
+    loads = json.loads
+
+
+def init_serializer(app):
+    """Make jsonify and request.get_json of app go through this module"""
+    try:
+        from flask.json.provider import DefaultJSONProvider
+    except ImportError:
+        # Flask < 2.2 only lets the encoder class be replaced
+        from flask.json import JSONEncoder
+
+        class ModelJSONEncoder(JSONEncoder):
+            def default(self, o):
+                if isinstance(o, (Model, CompactModel, Decimal)):
+                    return default(o)
+                return super().default(o)
+
+        app.json_encoder = ModelJSONEncoder
+        return
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj, kwargs.get('sort_keys', self.sort_keys)).decode()
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj, self.sort_keys), mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
@@ -1,4 +1,4 @@
-import os, json
+import os, json, threading
 from flask import Flask, jsonify
 from flask_session import Session
 
@@ -19,6 +19,10 @@ def create_app(test_config=None):
 
     sess.init_app(app)
 
+    # Serialize responses with the fastest available encoder, models included
+    from .Util.Serializer import init_serializer
+    init_serializer(app)
+
     # Blueprint for auth routes in our app
     from app.Controller import UserController as auth_blueprint
     app.register_blueprint(auth_blueprint.user)
@@ -33,6 +37,14 @@ def create_app(test_config=None):
     from .Controller import CustomerController as customer_blueprint
     app.register_blueprint(customer_blueprint.cust)
 
+    # Build the in-memory catalog indexes without delaying start up
+    from .Service import ProductService as product_service
+    threading.Thread(target=product_service.warm_up, daemon=True).start()
+
+    # Compress large responses for clients accepting gzip
+    from .Util.Compression import init_compression
+    init_compression(app)
+
     # Register Exception handler
     app.register_error_handler(HTTPException, lambda e: (jsonify({'message': e.description}), e.code))
 
@@ -18,8 +18,52 @@ API_ORG_KEY = "3a62ea5aa2d8845a72dd030369dd571d5123567f70fa76b5bc3bcdf103e3307cc
 # it would be better to create a table in the database and retrieve from there.
 SUPPLIER_ORG_ID = "11EAF2251136B090BB69B6800B5BCB6D"
 
+# SQUIZZ API sessions are pooled and reused across requests
+# Seconds after which a session is destroyed instead of reused
+SQUIZZ_SESSION_TTL = float(os.environ.get("SQUIZZ_SESSION_TTL") or 1800)
+# Sessions idle for longer than this (in seconds) are validated with SQUIZZ before being reused
+SQUIZZ_SESSION_VALIDATE_AFTER = float(os.environ.get("SQUIZZ_SESSION_VALIDATE_AFTER") or 300)
+# Maximum number of idle sessions kept per organisation
+SQUIZZ_SESSION_POOL_SIZE = int(os.environ.get("SQUIZZ_SESSION_POOL_SIZE") or 4)
+
 # MySQL Environment Variables
 HOST = os.environ.get("HOST") or "squizz-db.cuftfgbgib1y.us-east-1.rds.amazonaws.com"
 USER = os.environ.get("USER") or "admin"
 PASSWORD = os.environ.get("PASSWORD") or "12345678"
-DB_NAME = os.environ.get("DB_NAME") or "squizz_app"
\ No newline at end of file
+DB_NAME = os.environ.get("DB_NAME") or "squizz_app"
+
+# MySQL connection pool settings
+# Maximum number of connections opened by one process
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE") or 10)
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT") or 10)
+# Idle connections older than this (in seconds) are closed instead of reused
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE") or 300)
+# Idle connections older than this (in seconds) are pinged before being reused
+DB_POOL_PING_INTERVAL = float(os.environ.get("DB_POOL_PING_INTERVAL") or 30)
+
+# Seconds that cached pagination totals stay valid, writes made by this process invalidate them earlier
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL") or 300)
+
+# Product lookups (/api/barcode, /api/product) kept in memory, syncs made by this process invalidate them earlier
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE") or 5000)
+PRODUCT_CACHE_TTL = float(os.environ.get("PRODUCT_CACHE_TTL") or 300)
+# Seconds that lookups of unknown barcodes and product codes are answered from memory, scanners retry misreads
+PRODUCT_NOT_FOUND_TTL = float(os.environ.get("PRODUCT_NOT_FOUND_TTL") or 30)
+
+# Maximum number of identifiers returned by /api/products/search
+SEARCH_RESULT_LIMIT = int(os.environ.get("SEARCH_RESULT_LIMIT") or 50)
+
+# Maximum number of barcodes looked up by one /api/barcodes request
+BARCODE_BATCH_LIMIT = int(os.environ.get("BARCODE_BATCH_LIMIT") or 500)
+
+# gzip compression of responses
+# Smallest body (in bytes) worth compressing
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE") or 1024)
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL") or 6)
+# Compressed bodies kept for responses tagged with an ETag, e.g. catalog pages
+COMPRESS_CACHE_SIZE = int(os.environ.get("COMPRESS_CACHE_SIZE") or 256)
+COMPRESS_CACHE_TTL = float(os.environ.get("COMPRESS_CACHE_TTL") or 3600)
+
+# Products read, and written out, at a time by /api/catalog/export
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE") or 500)
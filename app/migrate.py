@@ -0,0 +1,170 @@
+"""
+Versioned schema migrations
+
+Migrations are the .sql files in app/migrations, applied in file name order
+(0001_..., 0002_...). Every applied version is recorded in the
+schema_migrations table, so a migration runs once per database.
+
+Usage:
+    python -m app.migrate           apply the pending migrations, then verify
+    python -m app.migrate status    list the migrations and whether they are applied
+    python -m app.migrate verify    EXPLAIN the hot queries, fail if one scans a whole table
+"""
+import logging
+import os
+import re
+import sys
+import pymysql
+from app.Resource.DatabaseBase import DatabaseBase
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+# MySQL errors meaning the change is already in place, e.g. an index added by hand
+# or a migration interrupted after some of its statements (DDL commits implicitly)
+ALREADY_APPLIED = {
+    1060,  # ER_DUP_FIELDNAME
+    1061,  # ER_DUP_KEYNAME
+}
+
+# MySQL errors meaning the change can not be made online on this server
+NOT_ONLINE = {
+    1845,  # ER_ALTER_OPERATION_NOT_SUPPORTED
+    1846,  # ER_ALTER_OPERATION_NOT_SUPPORTED_REASON
+}
+
+ONLINE_CLAUSE = re.compile(r',\s*ALGORITHM\s*=\s*\w+(\s*,\s*LOCK\s*=\s*\w+)?\s*$', re.IGNORECASE)
+
+# Queries run on every request, with the table each one must reach through an index
+HOT_QUERIES = [
+    ('ProductResource.get_product_by_barcode', 'products',
+     """SELECT products.id, prices.price FROM products JOIN prices ON products.id = prices.productId
+        WHERE products.barcode = %s""", ['9326243001262']),
+    ('SessionResource.validate_session', 'sessions',
+     """SELECT count(*) as num FROM sessions join organizations on organizations.id = sessions.organizationId
+        WHERE sessionKey = %s and organizations.organizationId = %s""", ['', '']),
+    ('OrderResource.get_order_history', 'sessions',
+     """SELECT organizations.id AS org_id FROM sessions INNER JOIN organizations
+        ON organizations.id = sessions.organizationId WHERE sessionKey = %s""", ['']),
+    ('ProductResource.assign_price_and_images_to_product', 'prices',
+     """SELECT productId, price, referenceType FROM prices WHERE productId IN (%s, %s, %s)
+        ORDER BY referenceType DESC""", [1, 2, 3]),
+]
+
+
+def read_statements(path):
+    """
+    Split a migration file into statements. Lines starting with -- are
+    comments, statements end with a semicolon.
+    """
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if not line.lstrip().startswith('--')]
+    return [statement.strip() for statement in ''.join(lines).split(';') if statement.strip()]
+
+
+class Migrator(DatabaseBase):
+    """
+    Applies the pending migrations and checks the query plans they are meant to fix
+    """
+
+    def __init__(self, migrations_dir=MIGRATIONS_DIR):
+        super().__init__()
+        self.migrations_dir = migrations_dir
+
+    def migrations(self):
+        """Returns (version, path) of every migration file, in the order they apply"""
+        return [(os.path.splitext(name)[0], os.path.join(self.migrations_dir, name))
+                for name in sorted(os.listdir(self.migrations_dir)) if name.endswith('.sql')]
+
+    def applied(self):
+        """Returns the versions recorded in schema_migrations"""
+        self._execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                            version VARCHAR(100) NOT NULL PRIMARY KEY,
+                            appliedOn DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)""")
+        rows = self.run_query('SELECT version FROM schema_migrations', [], False) or []
+        return {row['version'] for row in rows}
+
+    def pending(self):
+        """Returns (version, path) of the migrations not applied yet"""
+        applied = self.applied()
+        return [(version, path) for version, path in self.migrations() if version not in applied]
+
+    def migrate(self):
+        """
+        Apply the pending migrations in order and record each one. Stops at
+        the first statement that fails, leaving that migration pending.
+
+        :return: the versions applied
+        """
+        done = []
+        for version, path in self.pending():
+            logger.info("Applying migration %s", version)
+            for statement in read_statements(path):
+                self._apply(statement)
+            self.run_query('INSERT INTO schema_migrations (version) VALUES (%s)', [version], True)
+            done.append(version)
+        return done
+
+    def verify(self):
+        """
+        EXPLAIN every hot query
+
+        :return: a message for each query that still scans its table in full
+        """
+        problems = []
+        for name, table, query, values in HOT_QUERIES:
+            plan = self.run_query('EXPLAIN ' + query, values, False) or []
+            for row in plan:
+                if row.get('table') == table and row.get('type') == 'ALL':
+                    problems.append(f"{name} scans every row of {table} (possible keys: {row.get('possible_keys')})")
+        return problems
+
+    def _apply(self, statement):
+        """Run one DDL statement, online if the server allows it"""
+        try:
+            self._execute(statement)
+        except pymysql.err.MySQLError as e:
+            code = e.args[0] if e.args else None
+            if code in ALREADY_APPLIED:
+                logger.warning("Already applied, skipping: %s", e.args[1])
+            elif code in NOT_ONLINE and ONLINE_CLAUSE.search(statement):
+                logger.warning("Can not run online, retrying with table lock: %s", e.args[1])
+                self._execute(ONLINE_CLAUSE.sub('', statement))
+            else:
+                raise e
+
+    def _execute(self, statement):
+        self._ensure_connection()
+        self.cursor.execute(statement)
+        self.connection.commit()
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    command = argv[0] if argv else 'migrate'
+    if command not in ('migrate', 'status', 'verify'):
+        print(__doc__)
+        return 2
+    migrator = Migrator()
+
+    if command == 'status':
+        applied = migrator.applied()
+        for version, _ in migrator.migrations():
+            print(f"{'applied' if version in applied else 'pending'}  {version}")
+        return 0
+    if command == 'migrate':
+        done = migrator.migrate()
+        logger.info("Applied %d migration(s)", len(done))
+
+    problems = migrator.verify()
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        return 1
+    logger.info("All %d hot queries use an index", len(HOT_QUERIES))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
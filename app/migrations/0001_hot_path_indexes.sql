@@ -0,0 +1,14 @@
+-- Indexes for the lookups that run on every request.
+-- InnoDB builds secondary indexes in place, so reads and writes continue during the build.
+
+-- ProductResource.get_product_by_barcode, scanned from the mobile app
+ALTER TABLE products ADD INDEX barcode (barcode), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- SessionResource.validate_session, OrderResource.get_order_history
+ALTER TABLE sessions ADD INDEX sessionKey (sessionKey), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- ProductResource.assign_price_and_images_to_product, also serves the prices_ibfk_1 foreign key
+ALTER TABLE prices ADD INDEX productId_referenceType (productId, referenceType), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- Keyset pagination of a category, WHERE categoryId = %s AND productId > %s ORDER BY productId
+ALTER TABLE categoryproducts ADD INDEX categoryId_productId (categoryId, productId), ALGORITHM=INPLACE, LOCK=NONE;
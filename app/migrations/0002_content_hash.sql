@@ -0,0 +1,9 @@
+-- Hash of the fields each row was last written with by a SQUIZZ sync, see content_hash().
+-- A sync compares it with the hash of the retrieved record and leaves the row alone when they match.
+-- Rows written before this column existed have no hash, they are rewritten once by the next sync.
+
+-- ProductResource.update_products
+ALTER TABLE products ADD COLUMN contentHash CHAR(32) NULL, ALGORITHM=INPLACE, LOCK=NONE;
+
+-- ProductResource.update_prices
+ALTER TABLE prices ADD COLUMN contentHash CHAR(32) NULL, ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,44 @@
+"""
+Memory comparison of Product and CompactProduct on a synthetic catalog.
+
+Builds the catalog from database-shaped rows through SimpleModelResource.to_model,
+as list_all / iter_all do, and measures the memory held by the models
+with tracemalloc. Does not need a database.
+
+    python benchmarks/bench_compact_models.py [products]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.Model.Product import Product
+from app.Model.CompactModel import CompactProduct
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+from bench_converters import product_row
+
+
+def catalog_size(cls, rows):
+    SR.to_model(cls, rows[0])  # build the converter outside of the measurement
+    gc.collect()
+    tracemalloc.start()
+    catalog = [SR.to_model(cls, row) for row in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del catalog
+    return size
+
+
+def main(num_products):
+    rows = [product_row(i) for i in range(num_products)]
+    print(f'{num_products} products')
+    full = catalog_size(Product, rows)
+    compact = catalog_size(CompactProduct, rows)
+    print(f'Product         {full / 2 ** 20:8.1f} MiB  {full / num_products:6.0f} B/product')
+    print(f'CompactProduct  {compact / 2 ** 20:8.1f} MiB  {compact / num_products:6.0f} B/product  '
+          f'({full / compact:.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,81 @@
+"""
+Microbenchmark for SimpleModelResource.to_model / to_dict.
+
+Compares the compiled per-class converters with the previous implementation,
+which rebuilt fields_mapping() and went through Model.__init__ for every row.
+Does not need a database.
+
+    python benchmarks/bench_converters.py [rows]
+"""
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.Model.Product import Product
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+
+
+def legacy_to_model(cls, record_dict):
+    fields_mapping = cls.fields_mapping()
+    obj_dict = {}
+    for key in record_dict:
+        if key in fields_mapping:
+            obj_dict[fields_mapping[key]] = record_dict[key]
+    return cls(obj_dict)
+
+
+def legacy_to_dict(obj):
+    fields_mapping = obj.fields_mapping()
+    obj_dict = obj.__dict__.copy()
+    field_value_dict = {}
+    for key in obj_dict:
+        if key in fields_mapping:
+            field_value_dict[fields_mapping[key]] = obj_dict[key]
+    return field_value_dict
+
+
+def product_row(i):
+    """A row shaped like SELECT * FROM products"""
+    return {
+        'id': i, 'keyProductId': str(21479231976900 + i), 'barcode': str(9326243000000 + i),
+        'barcodeInner': None, 'description1': 'Tarpaulin 240cm x 300cm', 'description2': None,
+        'description3': None, 'description4': None, 'internalId': str(i), 'brand': None,
+        'height': Decimal('1.50'), 'depth': Decimal('0.00'), 'width': Decimal('2.40'), 'weight': Decimal('0.75'),
+        'volume': Decimal('0.00'), 'productCondition': 'NEW', 'isPriceTaxInclusive': 'N', 'isKitted': 'N',
+        'keyTaxcodeId': 'GST', 'stockQuantity': Decimal('12.00'), 'productName': f'Product {i}',
+        'kitProductsSetPrice': 'N', 'productCode': f'{i:05d}   ', 'productSearchCode': None,
+        'stockLowQuantity': Decimal('0.00'), 'averageCost': Decimal('4.10'), 'productDrop': None,
+        'packQuantity': Decimal('1.00'), 'supplierOrganizationId': '11EAF2251136B090BB69B6800B5BCB6D',
+        'keySellUnitID': None
+    }
+
+
+def rate(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return len(items) / (time.perf_counter() - start)
+
+
+def main(num_rows):
+    rows = [product_row(i) for i in range(num_rows)]
+    # Model.__init__ consumes its input dict, give each legacy call its own copy
+    legacy_rows = [dict(row) for row in rows]
+
+    assert legacy_to_model(Product, dict(rows[0])).__dict__ == SR.to_model(Product, rows[0]).__dict__
+    products = [SR.to_model(Product, row) for row in rows]
+    assert legacy_to_dict(products[0]) == SR.to_dict(products[0])
+
+    print(f'{num_rows} Product rows')
+    before = rate(lambda row: legacy_to_model(Product, row), legacy_rows)
+    after = rate(lambda row: SR.to_model(Product, row), rows)
+    print(f'to_model  before {before:>12,.0f} rows/s  after {after:>12,.0f} rows/s  x{after / before:.1f}')
+    before = rate(legacy_to_dict, products)
+    after = rate(SR.to_dict, products)
+    print(f'to_dict   before {before:>12,.0f} rows/s  after {after:>12,.0f} rows/s  x{after / before:.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
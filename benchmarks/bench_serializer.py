@@ -0,0 +1,61 @@
+"""
+Microbenchmark for serializing a page of /api/products.
+
+Compares json.dumps of the basic_dict() of every product, as jsonify did,
+with app.Util.Serializer (orjson when installed). Does not need a database.
+
+    python benchmarks/bench_serializer.py [pages]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app.Model.Image import Image
+from app.Model.Product import Product
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+from app.Util import Serializer
+from bench_converters import product_row
+
+
+def page(size=20):
+    products = [SR.to_model(Product, product_row(i)) for i in range(size)]
+    for product in products:
+        product.price = 12.5
+        product.imageList = [Image({'id': product.id, 'fileName': f'{product.productCode}.jpg',
+                                    'smallImageLocation': f'https://cdn.example.com/s/{product.productCode}.jpg',
+                                    'productId': product.id})]
+    return {'items': products, 'page': 1, 'page_size': size, 'total': 4430, 'total_pages': 222}
+
+
+def rate(func, pages):
+    start = time.perf_counter()
+    for _ in range(pages):
+        func()
+    return pages / (time.perf_counter() - start)
+
+
+def main(pages):
+    data = page()
+
+    def legacy():
+        body = dict(data, items=[product.basic_dict() for product in data['items']])
+        return json.dumps(body, sort_keys=True).encode()
+
+    def serializer():
+        body = dict(data, items=[product.basic_dict() for product in data['items']])
+        return Serializer.dumps(body)
+
+    assert json.loads(legacy()) == json.loads(serializer())
+    encoder = 'orjson' if Serializer.orjson is not None else 'json'
+    print(f'{pages} pages of 20 products, serializer using {encoder}')
+    before, after = rate(legacy, pages), rate(serializer, pages)
+    print(f'before {before:>10,.0f} pages/s  after {after:>10,.0f} pages/s  x{after / before:.1f}')
+    before = rate(lambda: [json.dumps(product.__dict__, default=lambda o: o.__dict__) for product in data['items']], pages)
+    after = rate(lambda: [product.to_json_bytes() for product in data['items']], pages)
+    print(f'Model.json  before {before:>10,.0f} pages/s  to_json_bytes {after:>10,.0f} pages/s  x{after / before:.1f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -31,3 +31,10 @@ def session_set():
     sess.permanent = True
     sess['login_session'] = "78C7030C644264F9DDBA41821ABD1E98"
     sess['org_id'] = "11EA64D91C6E8F70A23EB6800B5BCB6D"
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """A FakeDatabase every Resource created during the test runs its statements on, see fake_db"""
+    from fake_db import install
+    return install(monkeypatch)
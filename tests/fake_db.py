@@ -0,0 +1,111 @@
+"""
+In-memory stand-in for a MySQL connection, for testing Resources without a server
+"""
+import re
+from app.Resource import DatabaseBase as db
+from app.Resource.DatabaseBase import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.lastrowid = None
+        self.rowcount = 0
+        self.closed = False
+        self._rows = []
+
+    def execute(self, query, values=()):
+        values = list(values)
+        self.database.executed.append((query, values))
+        result = self.database.handler(query, values)
+        if isinstance(result, int):
+            self._rows, self.rowcount = [], result
+        else:
+            self._rows = list(result or [])
+            self.rowcount = len(self._rows)
+        self.lastrowid = self.database.lastrowid
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabase:
+    """
+    Connection answering statements with the responders registered with
+    on(). Every statement run is recorded in executed, every cursor
+    opened in cursors.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.executed = []
+        self.cursors = []
+        self.lastrowid = None
+        self.open = True
+        self.server_status = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def on(self, pattern, respond):
+        """
+        Answer the statements matching pattern with respond(values, match)
+
+        :param pattern: regular expression searched in the statement, with its whitespace collapsed
+        :param respond: returns the selected rows or the number of affected rows, or raises
+        """
+        self.routes.append((re.compile(pattern), respond))
+        return self
+
+    def handler(self, query, values):
+        query = ' '.join(query.split())
+        for pattern, respond in self.routes:
+            match = pattern.search(query)
+            if match:
+                return respond(values, match)
+        raise AssertionError(f'Unexpected statement {query}')
+
+    def cursor(self, cursor_class=None):
+        cursor = FakeCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+    def statements(self, prefix):
+        """Statements run that start with prefix, ignoring case and leading whitespace"""
+        return [(query, values) for query, values in self.executed
+                if query.lstrip().upper().startswith(prefix.upper())]
+
+
+def rows_of(values, width):
+    """Split the flat values of a multi-row statement into rows"""
+    return [values[i:i + width] for i in range(0, len(values), width)]
+
+
+def install(monkeypatch, max_allowed_packet=1 << 20, auto_increment_increment=1) -> FakeDatabase:
+    """Make every Resource created during the test run its statements on a new FakeDatabase"""
+    database = FakeDatabase()
+    monkeypatch.setattr(db, 'pool', ConnectionPool(size=4, timeout=1, connect=lambda: database))
+    monkeypatch.setattr(db, '_server_variables', {
+        'max_allowed_packet': max_allowed_packet,
+        'auto_increment_increment': auto_increment_increment
+    })
+    return database
@@ -0,0 +1,84 @@
+import pytest
+from pymysql import IntegrityError
+from app.Model.Address import Address
+from app.Resource.SimpleModelResource import SimpleModelResource as SR, insert_statement, statement
+from fake_db import install
+
+NUM_FIELDS = len(SR.to_dict(Address())) - 1
+
+
+def addresses(count, contact='x'):
+    return [Address({'contact': contact, 'postcode': str(i)}) for i in range(count)]
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """The addresses table: ids assigned like InnoDB, addresses whose postcode is 'BAD' rejected"""
+    def make(step=1, max_allowed_packet=1 << 20):
+        database = install(monkeypatch, max_allowed_packet, step)
+        next_id = [1]
+
+        def insert(values, match):
+            if 'BAD' in values:
+                raise IntegrityError(1452, 'Cannot add or update a child row')
+            num_rows = len(values) // NUM_FIELDS
+            database.lastrowid = next_id[0]
+            next_id[0] += num_rows * step
+            return num_rows
+
+        return database.on(r'^INSERT into addresses', insert)
+    return make
+
+
+def test_batch_insert_assigns_consecutive_ids(table):
+    database = table(step=2)
+    objs = addresses(5)
+
+    result = SR().batch_insert(objs, batch_size=3)
+
+    assert result == {'total': 5, 'success': 5, 'failed': 0, 'failed_objs': []}
+    assert len(database.statements('INSERT')) == 2
+    # Ids follow auto_increment_increment within a statement, the second statement continues after the first
+    assert [obj.id for obj in objs] == [1, 3, 5, 7, 9]
+
+
+def test_batch_insert_splits_chunks_by_bytes(table):
+    database = table(max_allowed_packet=2000)
+    objs = addresses(10, contact='c' * 200)
+
+    result = SR().batch_insert(objs)
+
+    inserts = database.statements('INSERT')
+    assert result['success'] == 10
+    assert len(inserts) > 1
+    assert all(sum(len(str(value)) + 4 for value in values) <= 1000 for _, values in inserts)
+    assert sum(len(values) for _, values in inserts) == 10 * NUM_FIELDS
+    assert [obj.id for obj in objs] == list(range(1, 11))
+
+
+def test_batch_insert_isolates_failing_rows(table):
+    database = table()
+    objs = addresses(8)
+    objs[5].postcode = 'BAD'
+
+    result = SR().batch_insert(objs)
+
+    assert result['success'] == 7
+    assert result['failed'] == 1
+    assert result['failed_objs'] == [objs[5]]
+    assert objs[5].id is None
+    assert len({obj.id for obj in objs if obj is not objs[5]}) == 7
+    # 0-7 fails, 0-3 succeeds, 4-7 fails, 4-5 fails, 4 succeeds, 5 fails, 6-7 succeeds
+    assert len(database.statements('INSERT')) == 7
+
+
+def test_multi_row_statements_are_not_cached():
+    fields = ('contact', 'postcode')
+    insert_statement('addresses', fields, 1)
+    cached = statement.cache_info().currsize
+
+    for num_rows in range(2, 50):
+        query = insert_statement('addresses', fields, num_rows)
+
+    assert query == 'INSERT into addresses (contact,postcode) VALUES ' + ','.join(['(%s,%s)'] * 49)
+    assert statement.cache_info().currsize == cached
@@ -0,0 +1,92 @@
+import threading
+from app.Util.Cache import CountCache, LRUCache, SingleFlight
+
+
+def test_count_cache_invalidate():
+    cache = CountCache(ttl=60)
+    cache.set('products', None, 10, cache.generation('products'))
+    cache.set('categoryproducts', 2079, 3, cache.generation('categoryproducts'))
+
+    assert cache.get('products') == 10
+    assert cache.get('categoryproducts', 2079) == 3
+    cache.invalidate('products')
+    assert cache.get('products') is None
+    assert cache.get('categoryproducts', 2079) == 3
+
+
+def test_count_cache_skips_stale_set():
+    cache = CountCache(ttl=60)
+    generation = cache.generation('products')
+    # A write invalidates the table while the count query is running
+    cache.invalidate('products')
+    cache.set('products', None, 10, generation)
+
+    assert cache.get('products') is None
+
+
+def test_count_cache_expiry():
+    cache = CountCache(ttl=-1)
+    cache.set('products', None, 10, cache.generation('products'))
+
+    assert cache.get('products') is None
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 1
+
+
+def test_lru_cache_invalidate_and_expiry():
+    cache = LRUCache(max_size=10, ttl=60)
+    generation = cache.generation()
+    cache.set('a', 1, generation)
+    cache.invalidate()
+    # Loaded before the invalidation, not stored
+    cache.set('b', 2, generation)
+
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+
+    cache.ttl = -1
+    cache.set('c', 3)
+    assert cache.get('c') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_single_flight_shares_running_load():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    loads, results = [], []
+
+    def load():
+        loads.append(1)
+        started.set()
+        release.wait(2)
+        return 'product'
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('9326243001262', load)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('9326243001262', load)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while flight.stats()['coalesced'] < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(2)
+
+    assert results == ['product'] * 4
+    assert len(loads) == 1
+    assert flight.stats() == {'calls': 1, 'coalesced': 3, 'in_flight': 0}
@@ -0,0 +1,29 @@
+from app.Service import ProductService
+from app.Util.CatalogVersion import catalog_version
+from app.Util.PrefixIndex import PrefixIndex
+
+
+def test_version_is_bumped_after_the_search_index_is_rebuilt(monkeypatch):
+    versions = []
+    monkeypatch.setattr(ProductService, 'build_search_index', lambda: versions.append(catalog_version.current()[0]))
+    before = catalog_version.current()[0]
+
+    ProductService._invalidate_catalog_caches(rebuild_search_index=True)
+
+    # The index was rebuilt while the old version was current, then the version changed
+    assert versions == [before]
+    assert catalog_version.current()[0] != before
+
+
+def test_failed_rebuild_drops_the_stale_index(monkeypatch):
+    def fail():
+        raise RuntimeError('database is gone')
+
+    monkeypatch.setattr(ProductService, 'build_search_index', fail)
+    monkeypatch.setitem(ProductService.search_indexes, 'barcode', PrefixIndex(['9300']))
+    before = catalog_version.current()[0]
+
+    ProductService._invalidate_catalog_caches(rebuild_search_index=True)
+
+    assert 'barcode' not in ProductService.search_indexes
+    assert catalog_version.current()[0] != before
@@ -0,0 +1,40 @@
+from flask import Flask, jsonify
+from app.Util import CatalogVersion
+from app.Util.CatalogVersion import CatalogVersion as Version, conditional
+
+
+def make_client(monkeypatch):
+    version = Version()
+    monkeypatch.setattr(CatalogVersion, 'catalog_version', version)
+    calls = []
+    app = Flask(__name__)
+
+    @app.route('/api/products')
+    @conditional
+    def products():
+        calls.append(1)
+        return jsonify({'items': []})
+
+    return app.test_client(), version, calls
+
+
+def test_not_modified_without_running_view(monkeypatch):
+    client, version, calls = make_client(monkeypatch)
+    first = client.get('/api/products')
+    etag = first.headers['ETag']
+
+    again = client.get('/api/products', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+    assert len(calls) == 1
+
+
+def test_bump_changes_etag(monkeypatch):
+    client, version, calls = make_client(monkeypatch)
+    etag = client.get('/api/products').headers['ETag']
+    version.bump()
+
+    response = client.get('/api/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(calls) == 2
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import pytest
+from flask import Flask
+from app.Controller.ProductController import product as product_blueprint
+from app.Service import ProductService
+from app.Util import CatalogVersion
+from app.Util.CatalogVersion import CatalogVersion as Version
+
+
+def category_row(id, key, parent=None):
+    return {'id': id, 'keyCategoryId': key, 'keyCategoryParentId': parent, 'categoryName': f'Category {key}'}
+
+
+CATEGORIES = [
+    category_row(1, 'TOOLS'),
+    category_row(2, 'SAWS', 'TOOLS'),
+    category_row(3, 'BLADES', 'SAWS'),
+    category_row(4, 'GARDEN'),
+    # Parent missing from the feed
+    category_row(5, 'ORPHAN', 'GONE'),
+    # Parents forming cycles, never reachable from a top level category
+    category_row(6, 'LOOP-A', 'LOOP-B'),
+    category_row(7, 'LOOP-B', 'LOOP-A'),
+    category_row(8, 'SELF', 'SELF'),
+]
+# categoryId -> productIds, product 11 is in a category and in its sub category
+CATEGORY_PRODUCTS = {1: [10, 11], 2: [11, 12], 3: [13], 5: [14], 6: [15]}
+
+
+@pytest.fixture
+def categories(database, monkeypatch):
+    """The categories above, with a fresh catalog version and no prebuilt tree"""
+    monkeypatch.setattr(CatalogVersion, 'catalog_version', Version())
+    monkeypatch.setattr(ProductService, 'category_tree', None)
+    return (database
+            .on(r'^SELECT \* FROM categories', lambda values, match: CATEGORIES)
+            .on(r'^SELECT categoryId, productId FROM categoryproducts$',
+                lambda values, match: [{'categoryId': category_id, 'productId': product_id}
+                                       for category_id, product_ids in CATEGORY_PRODUCTS.items()
+                                       for product_id in product_ids]))
+
+
+def test_tree_nests_sub_categories_and_counts_their_products(categories):
+    body, etag = ProductService.build_category_tree()
+    tree = json.loads(body)
+
+    assert [node['keyCategoryID'] for node in tree] == ['TOOLS', 'GARDEN']
+    tools, garden = tree
+    saws = tools['Children'][0]
+    assert [child['keyCategoryID'] for child in saws['Children']] == ['BLADES']
+    # Distinct products of the category and everything under it
+    assert (tools['productCount'], saws['productCount'], saws['Children'][0]['productCount']) == (4, 3, 1)
+    assert garden == dict(garden, Children=[], productCount=0)
+    assert etag == hashlib.sha1(body).hexdigest()
+
+
+def test_orphan_and_cyclic_categories_are_left_out(categories):
+    body, _ = ProductService.build_category_tree()
+
+    keys = set()
+
+    def collect(nodes):
+        for node in nodes:
+            keys.add(node['keyCategoryID'])
+            collect(node['Children'])
+
+    collect(json.loads(body))
+    assert keys == {'TOOLS', 'SAWS', 'BLADES', 'GARDEN'}
+
+
+def test_tree_is_built_once_and_served_with_its_etag(categories):
+    app = Flask(__name__)
+    app.register_blueprint(product_blueprint)
+    client = app.test_client()
+
+    first = client.get('/api/categories')
+    statements = len(categories.executed)
+    again = client.get('/api/categories')
+    CatalogVersion.catalog_version.bump()
+    unchanged = client.get('/api/categories', headers={'If-None-Match': first.headers['ETag']})
+
+    body, etag = ProductService.get_category_tree()
+    assert first.status_code == 200
+    assert first.data == body
+    assert first.headers['ETag'] == f'"{etag}"'
+    assert again.data == body
+    # A new catalog version misses @conditional, the unchanged tree still answers 304
+    assert unchanged.status_code == 304
+    assert len(categories.executed) == statements
@@ -0,0 +1,26 @@
+import pytest
+from app.Model.Product import Product
+from app.Model.CompactModel import CompactProduct, CompactImage
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+
+
+def test_same_contract_as_model():
+    row = {'id': 7, 'barcode': '9326243001262', 'productName': 'Tarpaulin', 'productCode': '01262  '}
+    product = SR.to_model(Product, row)
+    compact = SR.to_model(CompactProduct, row)
+
+    assert compact.__dict__ == product.__dict__
+    assert compact.basic_dict() == product.basic_dict()
+    assert CompactProduct.table_name() == Product.table_name()
+    assert CompactProduct.fields_mapping() == Product.fields_mapping()
+    assert SR.to_dict(compact) == SR.to_dict(product)
+
+
+def test_no_instance_dict():
+    product = CompactProduct({'id': 1})
+    product.imageList.append(CompactImage({'id': 2, 'productId': 1}))
+
+    with pytest.raises(AttributeError):
+        product.unknown = 1
+    assert CompactProduct({'id': 3}).imageList == []
+    assert '"imageList": [{"id": 2' in product.json()
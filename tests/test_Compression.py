@@ -0,0 +1,58 @@
+import gzip
+from flask import Flask, jsonify
+from app.Util import CatalogVersion
+from app.Util.CatalogVersion import CatalogVersion as Version, conditional
+from app.Util.Compression import init_compression
+
+
+def make_client():
+    app = Flask(__name__)
+    init_compression(app)
+
+    @app.route('/api/products')
+    def products():
+        return jsonify({'items': [{'productCode': 'CFP-600-12-LPP-%03d' % i} for i in range(200)]})
+
+    @app.route('/api/categories')
+    @conditional
+    def categories():
+        return jsonify({'items': [{'categoryName': 'Category %03d' % i} for i in range(200)]})
+
+    @app.route('/api/metadata/get')
+    def metadata():
+        return jsonify({'found': False})
+
+    return app.test_client()
+
+
+def test_gzip_when_accepted():
+    client = make_client()
+    plain = client.get('/api/products')
+    compressed = client.get('/api/products', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(compressed.data) == plain.data
+
+
+def test_small_bodies_are_not_compressed():
+    response = make_client().get('/api/metadata/get', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_gzip_body_has_a_weak_etag_and_is_still_revalidated(monkeypatch):
+    monkeypatch.setattr(CatalogVersion, 'catalog_version', Version())
+    client = make_client()
+    plain = client.get('/api/categories')
+    compressed = client.get('/api/categories', headers={'Accept-Encoding': 'gzip'})
+
+    assert plain.headers['ETag'] == '"%s"' % plain.get_etag()[0]
+    assert compressed.headers['ETag'] == 'W/' + plain.headers['ETag']
+
+    for etag in (plain.headers['ETag'], compressed.headers['ETag']):
+        again = client.get('/api/categories', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.headers['ETag'] == etag
@@ -0,0 +1,182 @@
+import threading
+import pytest
+from pymysql import OperationalError
+from app.Resource import DatabaseBase as db
+from app.Resource.DatabaseBase import ConnectionPool, PooledConnection, DatabaseBase, unit_of_work
+from app.Exception.exceptions import PoolTimeout, TransactionRolledBack
+
+
+class FakeConnection:
+    def __init__(self):
+        self.open = True
+        self.server_status = 0
+        self.pings = 0
+        self.rollbacks = 0
+        self.commits = 0
+
+    def cursor(self):
+        return object()
+
+    def commit(self):
+        self.commits += 1
+        self.server_status = 0
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.open:
+            raise Exception('Connection lost')
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status = 0
+
+    def close(self):
+        self.open = False
+
+
+def test_reuse_connection():
+    pool = ConnectionPool(size=2, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['checkouts'] == 2
+    assert pool.stats()['in_use'] == 1
+
+
+def test_rollback_on_checkin():
+    pool = ConnectionPool(size=1, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    conn = pool.acquire()
+    conn.server_status = 1  # SERVER_STATUS_IN_TRANS
+    pool.release(conn)
+
+    assert conn.rollbacks == 1
+
+
+def test_timeout_when_exhausted():
+    pool = ConnectionPool(size=1, timeout=0.05, max_idle=60, ping_interval=60, connect=FakeConnection)
+    pool.acquire()
+
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['waits'] == 1
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(size=1, timeout=2, max_idle=60, ping_interval=60, connect=FakeConnection)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, [conn]).start()
+
+    assert pool.acquire() is conn
+    assert pool.stats()['waits'] == 1
+
+
+def test_health_check_and_eviction():
+    pool = ConnectionPool(size=2, timeout=1, max_idle=60, ping_interval=0, connect=FakeConnection)
+    broken = pool.acquire()
+    pool.release(broken)
+    broken.open = False
+
+    fresh = pool.acquire()
+    assert fresh is not broken
+    assert pool.stats()['failed_pings'] == 1
+
+    pool.max_idle = -1
+    pool.release(fresh)
+    assert pool.acquire() is not fresh
+    assert pool.stats()['evicted'] == 1
+
+
+def test_pooled_connection_close_and_reconnect():
+    pool = ConnectionPool(size=1, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    conn = PooledConnection(pool)
+    conn.close()
+
+    assert not conn.open
+    assert pool.stats()['idle'] == 1
+    conn.ping(reconnect=True)
+    assert conn.open
+    assert pool.stats()['in_use'] == 1
+
+
+def test_unit_of_work_shares_connection(monkeypatch):
+    pool = ConnectionPool(size=2, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    monkeypatch.setattr(db, 'pool', pool)
+
+    with unit_of_work() as unit:
+        first, second = DatabaseBase(), DatabaseBase()
+        raw = unit.conn
+        first.connection.commit()
+        first.connection.close()
+        assert second.connection.open
+        assert pool.stats()['in_use'] == 1
+
+    assert raw.commits == 1
+    assert pool.stats()['in_use'] == 0
+
+
+def test_unit_of_work_rollback_on_error(monkeypatch):
+    pool = ConnectionPool(size=1, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    monkeypatch.setattr(db, 'pool', pool)
+
+    with pytest.raises(ValueError):
+        with unit_of_work() as unit:
+            raw = unit.conn
+            with unit_of_work():
+                raise ValueError()
+
+    assert raw.commits == 0
+    assert raw.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_unit_of_work_raises_when_a_caught_failure_rolled_it_back(monkeypatch):
+    pool = ConnectionPool(size=1, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    monkeypatch.setattr(db, 'pool', pool)
+
+    with pytest.raises(TransactionRolledBack):
+        with unit_of_work() as unit:
+            raw = unit.conn
+            try:
+                with unit_of_work():
+                    raise ValueError()
+            except ValueError:
+                pass
+
+    assert raw.commits == 0
+    assert raw.rollbacks == 1
+
+
+def test_unit_of_work_never_reconnects(monkeypatch):
+    pool = ConnectionPool(size=2, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    monkeypatch.setattr(db, 'pool', pool)
+
+    with pytest.raises(Exception, match='Connection lost'):
+        with unit_of_work() as unit:
+            resource = DatabaseBase()
+            unit.conn.open = False
+            resource.run_query('DELETE FROM prices', [], False)
+
+    assert pool.stats()['created'] == 1
+
+
+def test_unit_of_work_fails_when_the_server_rolled_back(database):
+    def deadlock(values, match):
+        raise OperationalError(1213, 'Deadlock found when trying to get lock')
+
+    database.on(r'^DELETE', deadlock).on(r'^INSERT', lambda values, match: 1)
+
+    with pytest.raises(TransactionRolledBack):
+        with unit_of_work():
+            resource = DatabaseBase()
+            resource.run_query('INSERT INTO prices VALUES (%s)', [1], True)
+            try:
+                resource.run_query('DELETE FROM prices', [], True)
+            except OperationalError:
+                # Retried on its own, this would be committed without the INSERT
+                resource.run_query('INSERT INTO prices VALUES (%s)', [2], True)
+
+    assert database.commits == 0
+    assert database.rollbacks == 1
@@ -0,0 +1,18 @@
+from app.Resource.DatabaseBase import content_hash
+from app.Resource.ProductResource import PRICE_COLUMNS, price_values
+from app.Model.Price import Price
+
+
+def test_content_hash_is_stable_and_sensitive():
+    values = ['P1', 'EA', 3.2, None, 'contract']
+    assert content_hash(values) == content_hash(list(values))
+    assert len(content_hash(values)) == 32
+    assert content_hash(values) != content_hash(['P1', 'EA', 3.3, None, 'contract'])
+    assert content_hash(['a', 'b']) != content_hash(['ab', ''])
+
+
+def test_price_values_end_with_their_hash():
+    price = Price({'keyProductID': 'P1', 'keySellUnitID': 'EA', 'price': 3.2})
+    values = price_values(price)
+    assert len(values) == len(PRICE_COLUMNS) - 1
+    assert values[-1] == content_hash(values[:-1])
@@ -0,0 +1,60 @@
+import datetime
+import importlib
+import pkgutil
+from decimal import Decimal
+import pytest
+import app.Model
+from app.Model.Model import Model
+from app.Model.CompactModel import CompactModel
+from app.Resource.SimpleModelResource import Converter, converter
+
+for module in pkgutil.iter_modules(app.Model.__path__):
+    importlib.import_module(f'app.Model.{module.name}')
+
+# The models mapped to a table, the ones SimpleModelResource loads rows into
+MODEL_CLASSES = sorted([cls for cls in Model.__subclasses__() + CompactModel.__subclasses__()
+                        if hasattr(cls, 'fields_mapping')], key=lambda cls: cls.__name__)
+
+
+def init_model(cls, row):
+    """A model built from a row the way to_model did before the converters: mapped, then Model.__init__"""
+    mapping = cls.fields_mapping()
+    return cls({mapping[column]: value for column, value in row.items() if column in mapping})
+
+
+def row_of(cls):
+    """A value for every column of cls: padded strings, Decimals, NULLs and datetimes for the dates"""
+    row = {}
+    for i, (column, attr) in enumerate(cls.fields_mapping().items()):
+        if attr.endswith('Date'):
+            row[column] = datetime.datetime(2020, 1, 1, 12, 0, i)
+        elif i % 3 == 0 or attr in Converter.STRIPPED:
+            row[column] = f' value {i}  '
+        elif i % 3 == 1:
+            row[column] = Decimal(i) / 4
+        else:
+            row[column] = None
+    return row
+
+
+@pytest.mark.parametrize('cls', MODEL_CLASSES, ids=lambda cls: cls.__name__)
+def test_converter_builds_the_same_model_as_init(cls):
+    full = row_of(cls)
+    missing = dict(list(full.items())[::2])
+    extra = dict(full, notAColumn=1, id=42)
+
+    for row in (full, missing, extra, {}):
+        loaded = converter(cls).load(dict(row))
+        expected = init_model(cls, dict(row))
+
+        assert type(loaded) is cls
+        assert loaded.__dict__ == expected.__dict__
+
+
+@pytest.mark.parametrize('cls', MODEL_CLASSES, ids=lambda cls: cls.__name__)
+def test_converter_does_not_share_mutable_defaults(cls):
+    first, second = converter(cls).load({}), converter(cls).load({})
+
+    for attr, value in first.__dict__.items():
+        if isinstance(value, (list, dict, set)):
+            assert value is not second.__dict__[attr]
@@ -0,0 +1,50 @@
+import json
+import pytest
+from app.Util.EsdStream import EsdStream
+
+DOCUMENT = {
+    'resultStatus': 1,
+    'message': 'The product data has been successfully obtained.',
+    'totalDataRecords': 3,
+    'configs': {'dataFields': 'keyProductID,productCode'},
+    'dataRecords': [
+        {'keyProductID': '21479231976900', 'productCode': '00089', 'price': 12.5},
+        {'keyProductID': '21479231976901', 'productCode': 'CFP-600/12 "LP"', 'price': 1234567},
+        {'keyProductID': '21479231976902', 'productCode': 'é', 'nested': [{'a': [1, 2]}, {}]},
+    ],
+    'dataTransferMode': 'COMPLETE',
+}
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 100000])
+def test_records_are_streamed(size):
+    text = json.dumps(DOCUMENT, indent=1)
+    stream = EsdStream(split(text, size))
+
+    assert stream.read_header() == {'resultStatus': 1, 'message': DOCUMENT['message'],
+                                    'totalDataRecords': 3, 'configs': DOCUMENT['configs']}
+    assert list(stream.records()) == DOCUMENT['dataRecords']
+    assert stream.header['dataTransferMode'] == 'COMPLETE'
+
+
+def test_document_without_records():
+    stream = EsdStream(split('{"resultStatus": 0, "result_code": "SESSION_INVALID"}', 5))
+
+    assert stream.read_header() == {'resultStatus': 0, 'result_code': 'SESSION_INVALID'}
+    assert list(stream.records()) == []
+
+
+def test_truncated_document():
+    closed = []
+    text = json.dumps(DOCUMENT)
+    stream = EsdStream(split(text[:text.index('CFP')], 10), close=lambda: closed.append(True))
+
+    records = stream.records()
+    assert next(records)['productCode'] == '00089'
+    with pytest.raises(ValueError):
+        next(records)
+    assert closed == [True]
@@ -0,0 +1,46 @@
+import pytest
+from pymysql import OperationalError
+from app.Model.Address import Address
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+
+
+@pytest.fixture
+def addresses(database):
+    """An addresses table of 5 rows, and a count query to check the connection is still usable"""
+    return (database
+            .on(r'^SELECT \* FROM addresses$', lambda values, match: [{'id': id} for id in range(1, 6)])
+            .on(r'^SELECT COUNT\(\*\) AS count FROM addresses$', lambda values, match: [{'count': 5}]))
+
+
+def test_iter_all_yields_every_row_and_closes_its_cursor(addresses):
+    resource = SR()
+
+    objs = list(resource.iter_all(Address, batch_size=2))
+
+    assert [obj.id for obj in objs] == [1, 2, 3, 4, 5]
+    assert all(isinstance(obj, Address) for obj in objs)
+    assert addresses.cursors[-1].closed
+
+
+def test_abandoned_iteration_closes_its_cursor_and_frees_the_connection(addresses):
+    resource = SR()
+    rows = resource.iter_all(Address, batch_size=2, as_model=False)
+
+    assert next(rows) == {'id': 1}
+    cursor = addresses.cursors[-1]
+    assert not cursor.closed
+    rows.close()
+
+    assert cursor.closed
+    assert resource.run_query('SELECT COUNT(*) AS count FROM addresses', [], False) == [{'count': 5}]
+
+
+def test_failed_iteration_closes_its_cursor(database):
+    def lost(values, match):
+        raise OperationalError(2013, 'Lost connection to MySQL server during query')
+
+    database.on(r'^SELECT \* FROM addresses$', lost)
+
+    with pytest.raises(OperationalError):
+        list(SR().iter_all(Address))
+    assert database.cursors[-1].closed
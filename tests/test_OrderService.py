@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from app.Resource import DatabaseBase as db
+from app.Resource.DatabaseBase import ConnectionPool, DatabaseBase
+from app.Service import OrderService
+from test_ConnectionPool import FakeConnection
+
+
+class FakeSR(DatabaseBase):
+    def find_one(self, model):
+        return SimpleNamespace(orgId=1)
+
+    def get_one_by_id(self, model):
+        return SimpleNamespace(keyProductID='P1', name='Apple', productCode='A1', id=model.id, price=None)
+
+
+class FakePR(DatabaseBase):
+    def assign_price_and_images_to_product(self, products):
+        products[0].price = 2.5
+
+
+class FakeOR(DatabaseBase):
+    def create_order(self, org, cust, deli, bill, details_list, result_code, instructions):
+        return details_list
+
+
+def test_save_order_holds_no_connection_during_submit(monkeypatch):
+    pool = ConnectionPool(size=1, timeout=1, max_idle=60, ping_interval=60, connect=FakeConnection)
+    monkeypatch.setattr(db, 'pool', pool)
+    monkeypatch.setattr(OrderService, 'SR', FakeSR)
+    monkeypatch.setattr(OrderService, 'PR', FakePR)
+    monkeypatch.setattr(OrderService, 'OR', FakeOR)
+
+    in_use = []
+
+    def submit_order(org, cust, details_list):
+        in_use.append(pool.stats()['in_use'])
+        return 'SERVER_SUCCESS', [{'priceTotalExTax': 5, 'priceTotalIncTax': 5.5}]
+
+    monkeypatch.setattr(OrderService.authUtil, 'build_connection',
+                        lambda: SimpleNamespace(submit_order=submit_order))
+
+    lines = OrderService.save_order('key', 1, 2, 3, [{'product_id': 7, 'quantity': 2}])
+
+    assert in_use == [0]
+    assert lines[0].unitPrice == 2.5
+    assert lines[0].totalPrice == 5.5
+    assert pool.stats()['in_use'] == 0
@@ -0,0 +1,21 @@
+import pytest
+from app.Util.Pagination import encode_cursor, decode_cursor
+from app.Exception.exceptions import IncorrectDataType
+
+
+def test_round_trip():
+    assert decode_cursor(encode_cursor(566)) == 566
+    assert decode_cursor(encode_cursor(372, 2079), 2079) == 372
+
+
+def test_first_page():
+    assert decode_cursor('') == 0
+    assert decode_cursor('', 2079) == 0
+
+
+def test_bad_cursor():
+    with pytest.raises(IncorrectDataType):
+        decode_cursor('not a cursor')
+    # Issued for another category
+    with pytest.raises(IncorrectDataType):
+        decode_cursor(encode_cursor(372, 2079), 2080)
@@ -0,0 +1,18 @@
+from app.Util.PrefixIndex import PrefixIndex
+
+
+def test_prefix_search():
+    index = PrefixIndex(['CFP-600-12', 'cfp-300', 'CFP-600-12', 'CPX-1', None, '01248'])
+
+    assert len(index) == 4
+    assert index.search('cfp', 10) == ['cfp-300', 'CFP-600-12']
+    assert index.search('CFP-6', 10) == ['CFP-600-12']
+    assert index.search('x', 10) == []
+    assert index.search('', 2) == ['01248', 'cfp-300']
+
+
+def test_prefix_search_limit():
+    index = PrefixIndex(['9326243%03d' % i for i in range(100)])
+
+    assert index.search('9326243', 5) == ['9326243000', '9326243001', '9326243002', '9326243003', '9326243004']
+    assert len(index.search('93262430', 50)) == 50
@@ -0,0 +1,109 @@
+import pytest
+from flask import Flask
+from app.Controller.ProductController import product as product_blueprint
+from app.Exception.exceptions import IncorrectDataType
+from app.Resource.ProductResource import ProductResource
+from app.Service import ProductService
+from app.Util import CatalogVersion
+from app.Util.CatalogVersion import CatalogVersion as Version
+
+PRODUCTS = [
+    {'id': 1, 'barcode': '9326243001262', 'productCode': 'CFP-600', 'productName': 'Tarpaulin'},
+    {'id': 2, 'barcode': '9330440008950', 'productCode': 'CFP-700  ', 'productName': 'Rope'},
+]
+# Product 1 has a list price and a contract price
+PRICES = [
+    {'productId': 1, 'price': 12.5, 'referenceType': None},
+    {'productId': 1, 'price': 10.0, 'referenceType': 'C'},
+    {'productId': 2, 'price': 3.0, 'referenceType': None},
+]
+IMAGES = [
+    {'id': 10, 'productId': 1, 'fileName': 'front.jpg', 'is3DModelType': 'N', 'threeDModelLocation': None},
+    {'id': 11, 'productId': 1, 'fileName': 'model.glb', 'is3DModelType': 'Y', 'threeDModelLocation': 'models/1.glb'},
+]
+METADATA = {'CFP-600': '{"colour": "blue"}'}
+
+
+@pytest.fixture
+def catalog(database, monkeypatch):
+    """The products, prices, images and metadata above, with empty product caches"""
+    monkeypatch.setattr(CatalogVersion, 'catalog_version', Version())
+    ProductService.product_cache.invalidate()
+    ProductService.not_found_cache.invalidate()
+
+    def product_detail(values, match):
+        column = match.group(1)
+        effective = {}
+        for row in sorted(PRICES, key=lambda row: row['referenceType'] or '', reverse=True):
+            effective.setdefault(row['productId'], row['price'])
+        return [dict(row, effectivePrice=effective.get(row['id']), metaJsonString=METADATA.get(row['productCode']))
+                for row in PRODUCTS if row[column] == values[0]][:1]
+
+    database.on(r'^SELECT products\.\*, \(SELECT price FROM prices WHERE prices\.productId = products\.id '
+                r'ORDER BY referenceType DESC LIMIT 1\) AS effectivePrice, .* '
+                r'FROM products WHERE products\.(barcode|productCode) = %s', product_detail)
+    database.on(r'^SELECT \* FROM images WHERE productId = %s ORDER BY id',
+                lambda values, match: [row for row in IMAGES if row['productId'] == values[0]])
+    yield database
+    ProductService.product_cache.invalidate()
+    ProductService.not_found_cache.invalidate()
+
+
+@pytest.fixture
+def client(catalog):
+    app = Flask(__name__)
+    app.register_blueprint(product_blueprint)
+    return app.test_client()
+
+
+@pytest.mark.parametrize('identifier, identifierType', [('9326243001262', 'barcode'), ('CFP-600', 'productCode')])
+def test_detail_by_barcode_or_product_code(catalog, identifier, identifierType):
+    product, meta_json_string = ProductResource().get_product_detail(identifier, identifierType)
+
+    assert product.id == 1
+    assert [image.fileName for image in product.imageList] == ['front.jpg', 'model.glb']
+    assert meta_json_string == '{"colour": "blue"}'
+    # The price and metadata come with the product, the images with a second query
+    assert len(catalog.executed) == 2
+
+
+def test_detail_has_the_contract_price_over_the_list_price(catalog):
+    assert ProductResource().get_product_detail('9326243001262', 'barcode')[0].price == 10.0
+    assert ProductResource().get_product_detail('9330440008950', 'barcode')[0].price == 3.0
+
+
+def test_detail_of_an_unknown_product(catalog):
+    assert ProductResource().get_product_detail('0000000000000', 'barcode') is None
+    with pytest.raises(IncorrectDataType):
+        ProductResource().get_product_detail('CFP-600', 'productName')
+
+
+def test_detail_service_parses_metadata_and_caches_found_and_missing_products(catalog):
+    found = ProductService.get_product_detail('CFP-600', 'productCode')
+    missing = ProductService.get_product_detail('NOPE', 'productCode')
+    statements = len(catalog.executed)
+
+    assert found['data']['price'] == 10.0
+    assert found['data']['metadata'] == {'colour': 'blue'}
+    assert found['data']['threeDModelLocation'] == 'models/1.glb'
+    assert missing['data'] is None
+    assert missing['Message'] == ProductService.NOT_FOUND
+
+    assert ProductService.get_product_detail('CFP-600', 'productCode') == found
+    assert ProductService.get_product_detail('NOPE', 'productCode') == missing
+    assert len(catalog.executed) == statements
+
+
+def test_detail_endpoint_answers_304_to_the_current_etag(client, catalog):
+    first = client.get('/api/product/detail?productCode=CFP-600')
+    statements = len(catalog.executed)
+
+    again = client.get('/api/product/detail?productCode=CFP-600', headers={'If-None-Match': first.headers['ETag']})
+    by_barcode = client.get('/api/product/detail?barcode=9330440008950')
+
+    assert first.status_code == 200
+    assert first.get_json()['data']['productCode'] == 'CFP-600'
+    assert again.status_code == 304
+    assert by_barcode.get_json()['data']['id'] == 2
+    # The 304 ran no statement, the barcode lookup ran its two
+    assert len(catalog.executed) == statements + 2
@@ -0,0 +1,85 @@
+import pytest
+from app.Model.Product import Product
+from app.Resource.ProductResource import ProductResource
+from app.Resource.SimpleModelResource import SimpleModelResource as SR
+from app.Service.ProductService import export_catalog
+from app.Util.Serializer import loads
+
+
+def product_row(id, barcode):
+    return {'id': id, 'barcode': barcode, 'keyProductId': f'K{id}', 'productCode': f'C{id}'}
+
+
+def image_row(id, product_id):
+    return {'id': id, 'fileName': f'{id}.jpg', 'productId': product_id}
+
+
+def ids_in(match):
+    return {int(id) for id in match.group(1).split(',')}
+
+
+@pytest.fixture
+def catalog(database):
+    """Answers the product, price, image and category queries of the lookups from lists of rows"""
+    def make(products, prices=(), images=()):
+        def prices_of(values, match):
+            return sorted([row for row in prices if row['productId'] in ids_in(match)],
+                          key=lambda row: row['referenceType'] or '', reverse=True)
+
+        def priced_products(values, match):
+            # The effective price is the first one in the order of prices_of()
+            effective = {}
+            for row in sorted(prices, key=lambda row: row['referenceType'] or '', reverse=True):
+                effective.setdefault(row['productId'], row['price'])
+            return [dict(row, effectivePrice=effective[row['id']]) for row in products
+                    if row['barcode'] in values and row['id'] in effective]
+
+        return (database
+                .on(r'^SELECT \* FROM \( SELECT products\.\*, .* WHERE products\.barcode IN', priced_products)
+                .on(r'^SELECT products\.\* FROM products$', lambda values, match: products)
+                .on(r'^SELECT categoryproducts\.productId', lambda values, match: [])
+                .on(r'^SELECT productId, price, referenceType FROM prices WHERE productId IN \(([^)]*)\)', prices_of)
+                .on(r'^SELECT \* FROM images WHERE productId IN \(([^)]*)\)',
+                    lambda values, match: [row for row in images if row['productId'] in ids_in(match)]))
+    return make
+
+
+def test_images_are_assigned_when_no_product_has_a_price(catalog):
+    catalog([product_row(1, 'B1'), product_row(2, 'B2')], images=[image_row(10, 1), image_row(11, 2)])
+    products = [SR.to_model(Product, product_row(1, 'B1')), SR.to_model(Product, product_row(2, 'B2'))]
+
+    ProductResource().assign_price_and_images_to_product(products)
+
+    assert [product.price for product in products] == [None, None]
+    assert [[image.fileName for image in product.imageList] for product in products] == [['10.jpg'], ['11.jpg']]
+
+
+def test_batch_lookup_requires_a_price_like_the_single_lookup(catalog):
+    database = catalog([product_row(1, 'B1'), product_row(2, 'B2'), product_row(3, 'B3'), product_row(4, 'B3')],
+            prices=[{'productId': 1, 'price': 2.5, 'referenceType': None},
+                    {'productId': 1, 'price': 2.0, 'referenceType': 'C'},
+                    {'productId': 4, 'price': 7.0, 'referenceType': None}],
+            images=[image_row(10, 1)])
+
+    products = ProductResource().get_products_by_barcodes(['B1', 'B2', 'B3'])
+
+    # B2 has no price, of the two B3 products only the second one has a price
+    assert sorted(products) == ['B1', 'B3']
+    assert products['B1'].price == 2.0
+    assert [image.fileName for image in products['B1'].imageList] == ['10.jpg']
+    assert products['B3'].id == 4
+    # The priced products with their price, then the images of the ones kept
+    assert len(database.executed) == 2
+
+
+def test_export_assigns_images_to_a_page_without_prices(catalog):
+    catalog([product_row(1, 'B1'), product_row(2, 'B2'), product_row(3, 'B3')],
+            prices=[{'productId': 3, 'price': 4.0, 'referenceType': None}],
+            images=[image_row(10, 1), image_row(11, 2), image_row(12, 3)])
+
+    lines = [loads(line) for chunk in export_catalog(batch_size=2) for line in chunk.splitlines()]
+
+    # The first page of two products has no price at all
+    assert [line['id'] for line in lines] == [1, 2, 3]
+    assert [line['price'] for line in lines] == [None, None, 4.0]
+    assert [[image['fileName'] for image in line['imageList']] for line in lines] == [['10.jpg'], ['11.jpg'], ['12.jpg']]
@@ -0,0 +1,210 @@
+import pytest
+from types import SimpleNamespace
+from pymysql import IntegrityError, OperationalError
+from app.Exception.exceptions import SchemaOutdated
+from app.Model.Price import Price
+from app.Model.Product import Product
+from app.Resource import ProductResource as product_module
+from app.Resource.ProductResource import ProductResource, PRICE_COLUMNS, PRODUCT_COLUMNS, product_values, price_values
+from app.Service import ProductService
+from fake_db import rows_of
+
+
+class CatalogTables:
+    """keyProductId -> contentHash of the 'products' and 'prices' tables, the id of a product is its position"""
+
+    def __init__(self, database, products=None, prices=None, migrated=True):
+        self.database = database
+        self.products = dict(products or {})
+        self.prices = dict(prices or {})
+        database.on(r'information_schema\.COLUMNS',
+                    lambda values, match: [{'tableName': table} for table in values] if migrated else [])
+        database.on(r'^SELECT keyProductId, contentHash FROM products WHERE keyProductId IN',
+                    lambda values, match: [{'keyProductId': key, 'contentHash': self.products[key]}
+                                           for key in values if key in self.products])
+        database.on(r'^SELECT keyProductId FROM products$',
+                    lambda values, match: [{'keyProductId': key} for key in self.products])
+        database.on(r'^SELECT keyProductId, id FROM products$',
+                    lambda values, match: [{'keyProductId': key, 'id': id} for id, key in enumerate(self.products, 1)])
+        database.on(r'^INSERT INTO products .* ON DUPLICATE KEY UPDATE', self.upsert_products)
+        database.on(r'^SELECT keyProductId, contentHash FROM prices WHERE keyProductId IN',
+                    lambda values, match: [{'keyProductId': key, 'contentHash': self.prices[key]}
+                                           for key in values if key in self.prices])
+        database.on(r'^SELECT keyProductId FROM prices$',
+                    lambda values, match: [{'keyProductId': key} for key in self.prices])
+        database.on(r'^INSERT INTO prices', self.insert_prices)
+        database.on(r'^UPDATE prices JOIN', self.update_prices)
+        database.on(r'^DELETE FROM prices WHERE keyProductId IN', self.delete_prices)
+
+    def upsert_products(self, values, match):
+        rows = rows_of(values, len(PRODUCT_COLUMNS))
+        if any(row[1] == 'BAD' for row in rows):
+            raise IntegrityError(1406, 'Data too long for column barcode')
+        for row in rows:
+            self.products[row[0]] = row[-1]
+        return len(rows)
+
+    def insert_prices(self, values, match):
+        rows = rows_of(values, len(PRICE_COLUMNS))
+        for row in rows:
+            self.prices[row[0]] = row[-2]
+        return len(rows)
+
+    def update_prices(self, values, match):
+        rows = rows_of(values, len(PRICE_COLUMNS) - 1)
+        for row in rows:
+            self.prices[row[0]] = row[-1]
+        return len(rows)
+
+    def delete_prices(self, values, match):
+        deleted = [key for key in values if key in self.prices]
+        for key in deleted:
+            del self.prices[key]
+        return len(deleted)
+
+
+def product(key, barcode='9300000000000', name='Apple'):
+    return Product({'keyProductID': key, 'barcode': barcode, 'name': name})
+
+
+def price(key, amount=2.5):
+    return Price({'keyProductID': key, 'keySellUnitID': 'EA', 'price': amount})
+
+
+@pytest.fixture
+def catalog(database, monkeypatch):
+    monkeypatch.setattr(product_module, '_content_hash_checked', False)
+    return lambda *args, **kwargs: CatalogTables(database, *args, **kwargs)
+
+
+def test_update_products_upserts_in_one_statement(catalog):
+    tables = catalog()
+
+    result = ProductResource().update_products([product('P1'), product('P2'), product('P3')])
+
+    assert len(tables.database.statements('INSERT')) == 1
+    assert set(tables.products) == {'P1', 'P2', 'P3'}
+    assert result['data']['inserted'] == 3
+    assert result['data']['failed'] == []
+
+
+def test_update_products_retries_a_failed_chunk_one_by_one(catalog):
+    tables = catalog()
+
+    result = ProductResource().update_products([product('P1'), product('P2', barcode='BAD'), product('P3')])
+
+    # The chunk of 3, then each product alone
+    assert len(tables.database.statements('INSERT')) == 4
+    assert set(tables.products) == {'P1', 'P3'}
+    assert result['data']['inserted'] == 2
+    assert len(result['data']['failed']) == 1
+    assert result['data']['failed'][0].startswith('P2')
+
+
+def test_update_products_reports_updated_and_retained(catalog):
+    tables = catalog({'P1': 'old', 'P9': 'old'})
+
+    result = ProductResource().update_products([product('P1'), product('P2')])
+
+    assert result['data']['inserted'] == 1
+    assert result['data']['updated'] == 1
+    # P9 is no longer retrieved, it is kept and reported
+    assert result['data']['retained'] == 1
+    assert result['data']['deleted'] == 0
+    assert tables.products['P1'] == product_values(product('P1'))[-1]
+    assert 'P9' in tables.products
+
+
+def test_update_products_skips_unchanged_products(catalog):
+    unchanged = product('P1')
+    tables = catalog({'P1': product_values(unchanged)[-1], 'P2': product_values(product('P2'))[-1]})
+
+    result = ProductResource().update_products([unchanged, product('P2', name='Pear')])
+
+    upserts = tables.database.statements('INSERT')
+    assert len(upserts) == 1
+    # Only the changed product is written
+    assert upserts[0][1][0] == 'P2'
+    assert result['data']['unchanged'] == 1
+    assert result['data']['updated'] == 1
+    assert result['data']['inserted'] == 0
+
+
+def test_update_prices_writes_only_new_and_changed_prices_and_deletes_removed_ones(catalog):
+    tables = catalog(products={'P1': None, 'P2': None, 'P3': None, 'P9': None},
+                     prices={'P1': price_values(price('P1'))[-1], 'P2': 'old', 'P9': 'old'})
+
+    result = ProductResource().update_prices([price('P1'), price('P2', 3.0), price('P3')])
+
+    assert {key: result['data'][key] for key in ('inserted', 'updated', 'unchanged', 'deleted')} == \
+        {'inserted': 1, 'updated': 1, 'unchanged': 1, 'deleted': 1}
+    assert result['data']['failed'] == []
+    assert len(tables.database.statements('INSERT')) == 1
+    assert len(tables.database.statements('UPDATE')) == 1
+    assert tables.prices == {key: price_values(price(key, amount))[-1]
+                             for key, amount in (('P1', 2.5), ('P2', 3.0), ('P3', 2.5))}
+
+
+def test_update_prices_reads_the_stored_hashes_of_one_batch_at_a_time(catalog):
+    tables = catalog(products={key: None for key in ('P1', 'P2', 'P3', 'P4', 'P5')}, prices={'P1': 'old'})
+
+    result = ProductResource().update_prices([price(key) for key in ('P1', 'P2', 'P3', 'P4', 'P5')], batch_size=2)
+
+    reads = [values for query, values in tables.database.statements('SELECT keyProductId, contentHash FROM prices')]
+    assert reads == [['P1', 'P2'], ['P3', 'P4'], ['P5']]
+    assert result['data']['inserted'] == 4
+    assert result['data']['updated'] == 1
+
+
+def test_update_prices_keeps_prices_when_nothing_is_retrieved(catalog):
+    tables = catalog(products={'P1': None}, prices={'P1': 'old'})
+
+    result = ProductResource().update_prices(iter([]))
+
+    assert result['data']['deleted'] == 0
+    assert tables.database.statements('DELETE') == []
+    assert tables.prices == {'P1': 'old'}
+
+
+def test_update_prices_fails_when_stored_prices_can_not_be_read(database, catalog):
+    def lost(values, match):
+        raise OperationalError(2013, 'Lost connection to MySQL server during query')
+
+    database.on(r'FROM prices', lost)
+    catalog(products={'P1': None})
+
+    with pytest.raises(OperationalError):
+        ProductResource().update_prices([price('P1')])
+
+    assert database.statements('INSERT') == []
+    assert database.statements('DELETE') == []
+
+
+def test_syncs_fail_before_writing_without_the_content_hash_columns(catalog):
+    tables = catalog(migrated=False)
+
+    with pytest.raises(SchemaOutdated) as error:
+        ProductResource().update_products([product('P1')])
+    with pytest.raises(SchemaOutdated):
+        ProductResource().store_prices([price('P1')])
+
+    assert '0002_content_hash' in error.value.description
+    assert len(tables.database.executed) == 2
+
+
+def test_restore_prices_reads_the_stream_before_deleting_prices(catalog, monkeypatch):
+    tables = catalog(products={'P1': None}, prices={'P1': 'old'})
+
+    def stream():
+        yield price('P1')
+        raise ConnectionError('SQUIZZ closed the connection')
+
+    monkeypatch.setattr(ProductService.authUtil, 'build_connection',
+                        lambda: SimpleNamespace(stream_organisation_data=lambda data_type, customer: (True, stream())))
+
+    with pytest.raises(ConnectionError):
+        ProductService.restore_prices()
+
+    # No transaction was opened, the prices were never deleted
+    assert tables.database.executed == []
+    assert tables.prices == {'P1': 'old'}
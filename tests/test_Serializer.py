@@ -0,0 +1,44 @@
+import datetime
+import json
+from decimal import Decimal
+from flask import Flask, jsonify
+from app.Model.Order import Order
+from app.Model.OrderDetail import OrderDetail
+from app.Model.CompactModel import CompactProduct
+from app.Util.Serializer import dumps, init_serializer
+
+
+def make_order():
+    order = Order({'id': 7, 'instructions': 'Leave at the door'})
+    order.lines = [OrderDetail({'id': 1, 'quantity': 2, 'unitPrice': 4.5})]
+    return order
+
+
+def test_models_are_serialized_without_mutation():
+    order = make_order()
+    data = json.loads(order.to_json_bytes())
+
+    assert data['id'] == 7
+    assert data['lines'][0]['quantity'] == 2
+    assert isinstance(order.lines[0], OrderDetail)
+    assert json.loads(order.json()) == data
+
+
+def test_decimal_datetime_and_compact_models():
+    product = CompactProduct({'id': 3, 'productCode': '01248  '})
+    data = json.loads(dumps({'price': Decimal('12.50'), 'on': datetime.datetime(2020, 10, 1, 9, 30),
+                             'product': product}))
+
+    assert data['price'] == 12.5
+    assert data['on'] == 'Thu, 01 Oct 2020 09:30:00 GMT'
+    assert data['product']['productCode'] == '01248'
+
+
+def test_jsonify_models():
+    app = Flask(__name__)
+    init_serializer(app)
+
+    with app.app_context():
+        response = jsonify({'order': make_order()})
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['order']['lines'][0]['id'] == 1
@@ -0,0 +1,91 @@
+import pytest
+from app.Service.SquizzGatewayService import SquizzGatewayService, SquizzSessionPool
+from app.Service import SquizzGatewayService as gateway_module
+
+
+class FakeGateway(SquizzGatewayService):
+    def __init__(self, valid=True):
+        super().__init__('https://api.squizz.com/rest/1', 'org', 'key', 'pw', 'supplier')
+        self.valid = valid
+        self.created = []
+        self.destroyed = []
+        self.validated = 0
+
+    def create_session(self):
+        session_id = f'session-{len(self.created)}'
+        self.created.append(session_id)
+        return session_id, "LOGIN_SUCCESS"
+
+    def validate_session(self, session_id):
+        self.validated += 1
+        return self.valid
+
+    def destroy_session(self, session_id):
+        self.destroyed.append(session_id)
+        return True
+
+
+def test_sessions_are_reused():
+    pool = SquizzSessionPool(max_idle=2, ttl=60, validate_after=60)
+    gateway = FakeGateway()
+    first, _ = pool.acquire(gateway)
+    pool.release(first)
+    second, _ = pool.acquire(gateway)
+
+    assert second is first
+    assert gateway.created == ['session-0']
+    assert gateway.validated == 0
+    assert pool.stats()['reuse_rate'] == 0.5
+
+
+def test_idle_sessions_are_validated_and_expired():
+    pool = SquizzSessionPool(max_idle=2, ttl=60, validate_after=-1)
+    gateway = FakeGateway(valid=False)
+    pooled, _ = pool.acquire(gateway)
+    pool.release(pooled)
+
+    assert pool.acquire(gateway)[0] is not pooled
+    assert gateway.validated == 1
+
+    pool.ttl = -1
+    pool.release(pooled)
+    pool.acquire(gateway)
+    assert gateway.destroyed == ['session-0']
+    assert pool.stats()['expired'] == 1
+
+
+def test_retry_on_session_invalid(monkeypatch):
+    pool = SquizzSessionPool(max_idle=2, ttl=60, validate_after=60)
+    monkeypatch.setattr(gateway_module, 'session_pool', pool)
+    gateway = FakeGateway()
+    stale, _ = pool.acquire(gateway)
+    pool.release(stale)
+
+    used = []
+
+    def call(session_id):
+        used.append(session_id)
+        return {'result_code': 'SESSION_INVALID' if session_id == stale.session_id else 'SERVER_SUCCESS'}
+
+    response, _ = gateway.with_session(call)
+    assert response['result_code'] == 'SERVER_SUCCESS'
+    assert used == ['session-0', 'session-1']
+
+    pool.close_all()
+    assert gateway.destroyed == ['session-1']
+
+
+def test_session_is_destroyed_when_the_call_fails(monkeypatch):
+    pool = SquizzSessionPool(max_idle=2, ttl=60, validate_after=60)
+    monkeypatch.setattr(gateway_module, 'session_pool', pool)
+    gateway = FakeGateway()
+
+    def call(session_id):
+        raise ConnectionError('Connection reset by peer')
+
+    with pytest.raises(ConnectionError):
+        gateway.with_session(call)
+
+    assert gateway.destroyed == ['session-0']
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['invalidated'] == 0
@@ -0,0 +1,19 @@
+from app.migrate import read_statements, ONLINE_CLAUSE
+
+
+def test_read_statements(tmp_path):
+    path = tmp_path / '0001_test.sql'
+    path.write_text("-- comment; with a semicolon\nALTER TABLE a ADD INDEX b (b);\n\n"
+                    "ALTER TABLE c\n  ADD INDEX d (d), ALGORITHM=INPLACE, LOCK=NONE;\n")
+
+    assert read_statements(str(path)) == [
+        'ALTER TABLE a ADD INDEX b (b)',
+        'ALTER TABLE c\n  ADD INDEX d (d), ALGORITHM=INPLACE, LOCK=NONE',
+    ]
+
+
+def test_online_clause_is_stripped_for_fallback():
+    statement = 'ALTER TABLE products ADD INDEX barcode (barcode), ALGORITHM=INPLACE, LOCK=NONE'
+
+    assert ONLINE_CLAUSE.sub('', statement) == 'ALTER TABLE products ADD INDEX barcode (barcode)'
+